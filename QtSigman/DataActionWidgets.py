@@ -367,7 +367,6 @@ class ProcedureWidget(QW.QWidget):
                                    "Wybierz przebieg")
                 return False
         else:
-            #TODO: Sprawdzanie czy odpowiednie dane są dostępne na tym zakresie
             if self.procedure.required_waves and not self.getSelectedWaves():
                 QW.QMessageBox.warning(self, "Błąd ogólny",
                     "Nie ma wszystkich wymaganych przebiegów")
@@ -376,6 +375,8 @@ class ProcedureWidget(QW.QWidget):
                 QW.QMessageBox.warning(self, "Błąd ogólny",
                     "Nie ma wszystkich wymaganych punktów")
                 return False
+        if not self._checkDataInTimeRange():
+            return False
         arguments = self.procedureArgumentsWidget.getArguments()
         if self.procedure.procedure_type == 'modify':
             wave = self.getSelectedWaves()['Przebieg']
@@ -392,6 +393,35 @@ class ProcedureWidget(QW.QWidget):
             return False
         return True
 
+    def _checkDataInTimeRange(self):
+        """Sprawdza, czy wybrane przebiegi mają dane na całym wybranym
+        zakresie czasu, a wybrane punkty - choć jeden punkt w nim.
+        """
+        beginTime, endTime = self.getTimeRange()
+        waveKeys = self.getSelectedWaveKeys()
+        if waveKeys:
+            coveringWaves = self.compositeDataWrapper.covering_waves(
+                beginTime, endTime)
+            missing = [key for key in waveKeys.values()
+                       if key not in coveringWaves]
+            if missing:
+                QW.QMessageBox.warning(self, "Błąd ogólny",
+                    "Przebiegi nie obejmują całego zakresu czasowego: "
+                    + ", ".join(missing))
+                return False
+        pointsKeys = self.getSelectedPointsKeys()
+        if pointsKeys:
+            pointsInRange = self.compositeDataWrapper.members_in_range(
+                beginTime, endTime)['points']
+            missing = [key for key in pointsKeys.values()
+                       if key not in pointsInRange]
+            if missing:
+                QW.QMessageBox.warning(self, "Błąd ogólny",
+                    "Brak punktów w zakresie czasowym: "
+                    + ", ".join(missing))
+                return False
+        return True
+
     def getSelectedWaveKeys(self):
         """Zwraca dict kluczy w Composite_data.waves wybranych 
         przebiegów. Jeśli nie zostały wybrane, zwraca None.
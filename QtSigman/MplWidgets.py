@@ -217,6 +217,17 @@ class PlotWidget(QW.QWidget):
             x, y = event.xdata, event.ydata
         return x, y
 
+    def _getPixelSize(self):
+        """Returns the width and height of a single pixel in data
+        coordinates of the axis of currently selected points, so that
+        distances to points can be measured in pixels.
+        """
+        selectedPoints = self.plotToolbar.getSelectedPointType()
+        visualPoints = self.vCollection.points[selectedPoints]
+        inv = visualPoints.mplObject.axes.transData.inverted()
+        (x1, y1), (x2, y2) = inv.transform(np.array(((0, 0), (1, 1))))
+        return abs(x2-x1), abs(y2-y1)
+
     def handlePress(self, event):
         mode = self.plotToolbar.getEditMode()
         selectedPoints = self.plotToolbar.getSelectedPointType()
@@ -243,8 +254,9 @@ class PlotWidget(QW.QWidget):
                 xData = points.get_xdata()
                 yData = points.get_ydata()
                 ind = [event.ind[0]]
+                xScale, yScale = self._getPixelSize()
                 self.vCollection.points[selectedPoints].data.delete_point(
-                    xData[ind], y=yData[ind])
+                    xData[ind], y=yData[ind], x_scale=xScale, y_scale=yScale)
         if mode is EditMode.Dynamic and event.mouseevent.button == 1:
             points = event.artist
             if(points.get_label() == selectedPoints):
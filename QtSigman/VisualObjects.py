@@ -115,16 +115,15 @@ class VWave(VObject):
         
         Overrides VObject.plot.
         """
+        waveBegin, waveEnd = self.data.time_span()
         if beginTime is None:
-            beginTime = self.data.offset
+            beginTime = waveBegin
         else:
-            beginTime = max(beginTime, 
-                            self.data.offset)
+            beginTime = max(beginTime, waveBegin)
         if endTime is None:
-            endTime = self.data.offset + self.data.complete_length
+            endTime = waveEnd
         else:
-            endTime = min(endTime, 
-                          self.data.offset + self.data.complete_length)
+            endTime = min(endTime, waveEnd)
 
         x, y = self.data.generate_coordinate_tables(
             begin_time=beginTime,
@@ -199,7 +198,7 @@ class VParameter(VObject):
             endTime = min(endTime,
                           max(self.data.end_times))
 
-        lineTuples = self.generate_parameter_line_tuples(
+        lineTuples = self.data.generate_parameter_line_tuples(
             begin_time=beginTime, end_time=endTime)
         if len(self.mplObject) != len(lineTuples):
             self.deleteMplObject()
@@ -40,13 +40,47 @@ class QWave(sm.Wave, QDataObject):
         super().__init__(data.data,
                          data.complete_length,
                          data.type,
-                         offset=data.offset)
+                         offset=data.offset,
+                         value_scale=data.value_scale,
+                         value_offset=data.value_offset)
         QDataObject.__init__(self)
+        # Data is shared with the given Wave until either of them
+        # is modified
+        self._share_data(data)
 
     def replace_slice(self, begin_time, end_time, wave):
         super().replace_slice(begin_time, end_time, wave)
         self.changed.emit()
 
+class QIrregularWave(QWave, sm.IrregularWave):
+    """QWave keeping the sample timestamps of an sm.IrregularWave."""
+
+    def __init__(self, data):
+        sm.IrregularWave.__init__(self, data.data,
+                                  data.timestamps,
+                                  data.type,
+                                  offset=data.offset,
+                                  value_scale=data.value_scale,
+                                  value_offset=data.value_offset,
+                                  tolerance=data.tolerance,
+                                  sample_length=data.sample_length)
+        QDataObject.__init__(self)
+        self._share_data(data)
+
+class QWaveExpression(QWave, sm.WaveExpression):
+    """QWave keeping an sm.WaveExpression lazy. Its values are
+    recomputed from the current waves of the expression, so it emits
+    self.changed whenever one of them changes.
+    """
+
+    def __init__(self, data):
+        sm.WaveExpression.__init__(self, data._root, data.type)
+        QDataObject.__init__(self)
+
+    def _member_changed(self, leaf):
+        super()._member_changed(leaf)
+        self.changed.emit()
+
 class QPoints(sm.Points, QDataObject):
     """Extends sm.Points to emit a self.changed Qt signal whenever any
     operation changes it.
@@ -55,7 +89,10 @@ class QPoints(sm.Points, QDataObject):
     def __init__(self, data):
         super().__init__(data.data_x,
                          data.data_y,
-                         data.type)
+                         data.type,
+                         assume_sorted=True,
+                         columns={name: data.column(name)
+                                  for name in data.column_names})
         QDataObject.__init__(self)
 
     def delete_slice(self, begin_time, end_time):
@@ -66,16 +103,17 @@ class QPoints(sm.Points, QDataObject):
         super().replace_slice(begin_time, end_time, points)
         self.changed.emit()
 
-    def add_point(self, x, y):
-        super().add_point(x, y)
+    def add_point(self, x, y, **attributes):
+        super().add_point(x, y, **attributes)
         self.changed.emit()
 
-    def add_points(self, points, begin_time=0):
-        super().add_points(points, begin_time=begin_time)
+    def add_points(self, points, begin_time=0, tolerance=None):
+        super().add_points(points, begin_time=begin_time, 
+                           tolerance=tolerance)
         self.changed.emit()
 
-    def delete_point(self, x, y=None):
-        super().delete_point(x, y=y)
+    def delete_point(self, x, y=None, x_scale=1, y_scale=1):
+        super().delete_point(x, y=y, x_scale=x_scale, y_scale=y_scale)
         self.changed.emit()
 
     def move_point(self, x1, y1, x2, y2):
@@ -90,19 +128,36 @@ class QPoints(sm.Points, QDataObject):
         super().move_in_time(time)
         self.changed.emit()
 
+    def add_column(self, name, values):
+        super().add_column(name, values)
+        self.changed.emit()
+
+    def delete_column(self, name):
+        super().delete_column(name)
+        self.changed.emit()
+
 class QParameter(sm.Parameter, QDataObject):
     """Extends sm.Parameter to emit a self.changed Qt signal whenever
     any operation changes it.
     """
 
-    def __init__(self, parameter_type):
-        super().__init__(parameter_type)
+    def __init__(self, data):
+        super().__init__(data.type)
         QDataObject.__init__(self)
+        # Parameter arrays are never modified in place, so they can be
+        # shared with data
+        self.begin_times = data.begin_times
+        self.end_times = data.end_times
+        self.values = data.values
 
     def add_value(self, begin_time, end_time, value):
         super().add_value(begin_time, end_time, value)
         self.changed.emit()
 
+    def add_values(self, begin_times, end_times, values):
+        super().add_values(begin_times, end_times, values)
+        self.changed.emit()
+
 class CompositeDataWrapper(sm.Composite_data, QC.QObject):
     """Class extending sm.Composite_data with Qt signals and methods
     that allow for external editing (e.g. via functions from
@@ -169,9 +224,19 @@ class CompositeDataWrapper(sm.Composite_data, QC.QObject):
         
         Overrides add_wave.
         """
+        # QWave and VWave handle a single channel only
+        if isinstance(wave, sm.MultiChannelWave):
+            raise ValueError('MultiChannelWave cannot be displayed; add '
+                             'its channels separately (see '
+                             'MultiChannelWave.channel)')
         # super().add_wave checks if it's possible to add it
         super().add_wave(wave, dict_type, replace=replace)
-        self.waves[dict_type] = QWave(wave)
+        if isinstance(wave, sm.WaveExpression):
+            self.waves[dict_type] = QWaveExpression(wave)
+        elif isinstance(wave, sm.IrregularWave):
+            self.waves[dict_type] = QIrregularWave(wave)
+        else:
+            self.waves[dict_type] = QWave(wave)
         self.waves[dict_type].toDelete.connect(
             lambda: self.delete_wave(dict_type))
         self.waves[dict_type].toSetKey.connect(
@@ -208,13 +273,21 @@ class CompositeDataWrapper(sm.Composite_data, QC.QObject):
                 dictTypeTo, key))
         self.waveKeyChanged.emit(dictTypeFrom, dictTypeTo)
 
-    def add_points(self, points, dict_type, join=False):
+    def add_points(self, points, dict_type, join=False, tolerance=None):
         """Adds a Points instance as a QPoints and emits
-        pointNumberChanged signal.
+        pointNumberChanged signal. If join is True and dict_type is
+        already taken, the points are merged into the existing QPoints,
+        which emits a single changed signal instead.
         
         Overrides add_points.
         """
-        super().add_points(points, dict_type, join=join)
+        if dict_type is None:
+            dict_type = points.type
+        joined = join and dict_type in self.points
+        super().add_points(points, dict_type, join=join, 
+                           tolerance=tolerance)
+        if joined:
+            return
         self.points[dict_type] = QPoints(points)
         self.points[dict_type].toDelete.connect(
             lambda: self.delete_points(dict_type))
@@ -253,7 +326,9 @@ class CompositeDataWrapper(sm.Composite_data, QC.QObject):
         
         Overrides add_parameter.
         """
-        super().add_parameter(points, dict_type, replace=replace)
+        if dict_type is None:
+            dict_type = parameter.type
+        super().add_parameter(parameter, dict_type, replace=replace)
         self.parameters[dict_type] = QParameter(parameter)
         self.parameters[dict_type].toDelete.connect(
             lambda: self.delete_parameter(dict_type))
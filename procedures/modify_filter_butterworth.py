@@ -86,7 +86,9 @@ def procedure(wave, begin_time, end_time, arguments):
     wn = 2*arguments['Wn'] / wave.sample_rate # funkcja butter(...) przyjmuje częstotliwość graniczną od 0 do 1, gdzie 1 to częstotliwość nyquista sygnału; tutaj zachodzi konwersja z hz na argument dla filtru
     b, a = butter(arguments['N'], wn, btype=arguments['btype'])
     data = wave.data_slice(begin_time, end_time)
-    return filtfilt(b, a, data)
+    # Filtrujemy wzdłuż osi czasu, więc w przypadku MultiChannelWave
+    # wszystkie kanały filtrowane są jednym wywołaniem
+    return filtfilt(b, a, data, axis=-1)
 
 def execute(wave, begin_time, end_time, arguments):
     "Sprawdza poprawność argumentów i wykonuje procedurę."
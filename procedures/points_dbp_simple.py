@@ -62,23 +62,22 @@ def procedure(waves, points, begin_time, end_time, arguments):
     sample_length = wave.sample_length
     data = wave.data_slice(begin_time, end_time)
     data = np.array(data)
-    # pierwsze dwie wartości puste dla konsystencji czasowej z data
-    derivative = [0] * 2 # 
-    for i in range(2,len(data)-2):
-        derivative.append(
-            (1/8) * (-data[i-2]-2*data[i-1]+2*data[i+1]+data[i+2]))
-    derivative = derivative + [0] * 2 # dla konsystencji z data
-    derivative = np.array(derivative)
+    # pierwsze i ostatnie dwie wartości puste dla konsystencji czasowej
+    # z data
+    derivative = np.zeros(len(data))
+    derivative[2:-2] = (
+        (1/8) * (-data[:-4]-2*data[1:-3]+2*data[3:-1]+data[4:]))
 
     # Przeprowadzamy całkowanie zakresowe (tłum. window integration) 
-    # kwadratu pochodnej
+    # pochodnej za pomocą sum prefiksowych - suma na oknie to różnica
+    # dwóch z nich
     window_width = 0.15/sample_length # 150 ms
     half_window = int(window_width/2) 
-    integral = [0]  * half_window  # dla konsystencji czasowej z data
-    for i in range(half_window, len(derivative)-half_window):
-        integral.append(np.sum(derivative[i-half_window:i+half_window]))
-    integral = integral + [0] * half_window # konsystencja
-    integral = np.array(integral)
+    prefix_sums = np.concatenate(([0], np.cumsum(derivative)))
+    integral = np.zeros(len(derivative)) # konsystencja czasowa z data
+    integral[half_window:len(derivative)-half_window] = (
+        prefix_sums[2*half_window:len(derivative)]
+        - prefix_sums[:len(derivative)-2*half_window])
     
     # Przejeżdżamy przez cały wykres i patrzymy gdzie całka pochodnej powyżej 
     # wartości granicznej. Tam, gdzie jest ona wyższa, odnajdujemy najniższą
@@ -74,28 +74,24 @@ def interpret_arguments(arguments):
         'focus_range':focus_range,
         'test_every':test_every}
 
-def _generate_input_data_sample(bp_line, ecg_line, test_point, sample_length, 
-                               detection_point_offset, input_point_count):
-    """Generuje pojedyncze dane wejsciowe z wycinka wykresu EKG i BP
-    do sprawdzenia siecią neuronową.
+def _generate_input_data(bp_line, ecg_line, test_points, sample_length,
+                         detection_point_offset, input_point_count):
+    """Generuje dane wejsciowe z wycinków wykresu EKG i BP do
+    sprawdzenia siecią neuronową; każdy wiersz zwróconej tablicy
+    odpowiada jednemu z test_points.
     """
-    begin_time = test_point - detection_point_offset
-    end_time = begin_time + sample_length
-    bp_data = bp_line.data_slice(begin_time, end_time, 
-                                 value_count = int(input_point_count/2))
-    ecg_data = ecg_line.data_slice(begin_time, end_time, 
-                                   value_count = int(input_point_count/2))
-    # Normalizujemy dane dla sieci do zakresu <-1; 1>
-    bp_data-=np.min(bp_data)
-    bp_data/=np.max(bp_data)
-    bp_data*=2
-    bp_data-=1
-    ecg_data-=np.min(ecg_data)
-    ecg_data/=np.max(ecg_data)
-    ecg_data*=2
-    ecg_data-=1
-    # Łączymy wycinek BP i EKG
-    input_data = np.concatenate((bp_data,ecg_data))
+    begin_times = test_points - detection_point_offset
+    bp_data = bp_line.data_slices(begin_times, sample_length,
+                                  value_count = int(input_point_count/2))
+    ecg_data = ecg_line.data_slices(begin_times, sample_length,
+                                    value_count = int(input_point_count/2))
+    # Normalizujemy dane dla sieci do zakresu <-1; 1> w każdym wierszu
+    bp_data = bp_data - np.min(bp_data, axis=1, keepdims=True)
+    bp_data = 2 * bp_data / np.max(bp_data, axis=1, keepdims=True) - 1
+    ecg_data = ecg_data - np.min(ecg_data, axis=1, keepdims=True)
+    ecg_data = 2 * ecg_data / np.max(ecg_data, axis=1, keepdims=True) - 1
+    # Łączymy wycinki BP i EKG
+    input_data = np.concatenate((bp_data,ecg_data), axis=1)
     return input_data
 
 def procedure(waves, points, begin_time, end_time, arguments):
@@ -111,30 +107,23 @@ def procedure(waves, points, begin_time, end_time, arguments):
     input_point_count = net.input_point_count
     
     sbp_x, sbp_y = sbp_points.data_slice(begin_time, end_time, left_offset = 1)
-    dn_x = []
-    dn_y = []
-    for helper_x in sbp_x:
-        if helper_x + focus_range[0] - sample_length < begin_time:
-            continue
-        if helper_x + focus_range[1] - detection_point_offset + sample_length > end_time:
-            break
-        focus_begin_time = helper_x + focus_range[0]
-        focus_end_time = helper_x + focus_range[1]
-        max_val = -1
-        max_x = 0
-        for test_x in np.arange(focus_begin_time, focus_end_time, test_every):
-            input_data = _generate_input_data_sample(
-                bp_line, ecg_line, test_x, 
-                sample_length, detection_point_offset, 
-                input_point_count)
-            val = net.forward(input_data)[0][0]
-            if val > max_val:
-                max_val = val
-                max_x = test_x
-        dn_x.append(max_x)
-        dn_y.append(bp_line.value_at(max_x))
-    dn_x = np.array(dn_x)
-    dn_y = np.array(dn_y)
+    # Pomijamy SBP, dla których badany zakres wychodziłby poza
+    # początek danych, i kończymy na pierwszym, dla którego wychodziłby
+    # poza koniec
+    after_begin = sbp_x + focus_range[0] - sample_length >= begin_time
+    past_end = (sbp_x + focus_range[1] - detection_point_offset
+                + sample_length > end_time)
+    sbp_x = sbp_x[after_begin & (np.cumsum(past_end) == 0)]
+    # Wszystkie badane punkty wszystkich SBP sprawdzamy siecią naraz
+    test_offsets = np.arange(focus_range[0], focus_range[1], test_every)
+    test_x = sbp_x[:, None] + test_offsets
+    input_data = _generate_input_data(
+        bp_line, ecg_line, test_x.ravel(),
+        sample_length, detection_point_offset,
+        input_point_count)
+    vals = net.forward(input_data)[:, 0].reshape(test_x.shape)
+    dn_x = test_x[np.arange(len(sbp_x)), np.argmax(vals, axis=1)]
+    dn_y = bp_line.value_at_many(dn_x)
     return dn_x, dn_y
 
 def execute(waves, points, begin_time, end_time, arguments):
@@ -7,6 +7,11 @@ na sygnale EKG).
 
 W tym pliku definiowane są klasy symbolizujące dane:
 Wave -- rzebieg sygnału (np. sygnał EKG)
+MultiChannelWave -- kilka przebiegów o wspólnej podstawie czasu
+IrregularWave -- przebieg sygnału o nieregularnym próbkowaniu
+AppendableWave -- przebieg sygnału, do którego można dopisywać dane
+WaveExpression -- przebieg wyliczany leniwie z innych przebiegów 
+                  (patrz expr)
 Points -- zestaw punktów (np. punkty R)
 Parameter -- parametr obliczony w kilku odcinkach czasowych
 Composite_data -- klasa łącząca kilka Wave oraz Points,
@@ -14,57 +19,635 @@ Composite_data -- klasa łącząca kilka Wave oraz Points,
                   rodzajów punktów
 """
 # TODO: Documentation should be PEP-257 compliant
+from bisect import bisect_left
+from fractions import Fraction
+import itertools
 from math import isclose
+import warnings
+import weakref
 
 import numpy as np
 
-class Wave():
+def _encode_values(values, dtype, value_scale, value_offset):
+    """Przelicza wartości w jednostkach fizycznych na wartości typu
+    dtype, odwrotnie do data * value_scale + value_offset.
+    """
+    values = np.asarray(values)
+    if value_scale != 1 or value_offset != 0:
+        values = (values-value_offset) / value_scale
+    if np.issubdtype(dtype, np.integer):
+        dtype_info = np.iinfo(dtype)
+        values = np.rint(values)
+        if np.any((values < dtype_info.min) | (values > dtype_info.max)):
+            warnings.warn('Wartości wykraczają poza zakres typu %s i '
+                          'zostały przycięte' % dtype, RuntimeWarning,
+                          stacklevel=3)
+            values = np.clip(values, dtype_info.min, dtype_info.max)
+    return values.astype(dtype, copy=False)
+
+class _RangeStatistics():
+    """Indeks pozwalający szybko obliczać statystyki (sumę, średnią,
+    wariancję, minimum i maksimum) na dowolnym zakresie punktów Wave.
+    Przechowuje sumy prefiksowe wartości oraz ich kwadratów, a także
+    minima i maksima bloków po block_size punktów wraz z tablicą
+    rzadką (sparse table) pozwalającą odczytać minimum/maksimum
+    dowolnego ciągu bloków w czasie O(1). Sumowane wartości są
+    pomniejszone o pierwszą wartość przebiegu, by wariancja liczona
+    z różnicy średnich nie traciła precyzji dla wartości odległych
+    od zera.
+
+    Po zmianie danych wystarczy wywołać invalidate z zakresem zmienionych
+    punktów; indeks zostanie uaktualniony przy następnym zapytaniu.
+    Tablice indeksu mają zapas miejsca, więc dopisanie punktów (patrz
+    AppendableWave) uaktualnia tylko ich końcówki.
+    """
+    block_size = 256
+
+    def __init__(self, wave):
+        self._wave = wave
+        self._length = None
+        self._dirty = (0, len(wave))
+
+    def invalidate(self, begin_i, end_i):
+        """Zaznacza, że punkty z zakresu <begin_i; end_i) się zmieniły."""
+        if self._dirty is not None:
+            begin_i = min(begin_i, self._dirty[0])
+            end_i = max(end_i, self._dirty[1])
+        self._dirty = (begin_i, end_i)
+
+    def _values(self, begin_i, end_i):
+        wave = self._wave
+        return np.asarray(wave._decode(wave.data[..., begin_i:end_i]),
+                          dtype=float)
+
+    @staticmethod
+    def _grown(array, size):
+        """Zwraca array, jeśli ma co najmniej size elementów wzdłuż
+        ostatniej osi, a w przeciwnym razie jej kopię powiększoną co 
+        najmniej dwukrotnie.
+        """
+        if array.shape[-1] >= size:
+            return array
+        grown = np.empty(array.shape[:-1] + (max(size, 2*array.shape[-1]),))
+        grown[..., :array.shape[-1]] = array
+        return grown
+
+    def _refresh(self):
+        if self._dirty is None:
+            return
+        length = len(self._wave)
+        begin_i, end_i = self._dirty
+        if not self._length or length < self._length:
+            # Indeks budowany jest od nowa
+            begin_i = 0
+            first_values = self._values(0, min(length, 1))
+            self._shift = np.zeros(first_values.shape[:-1] + (1,))
+            self._shift[..., :first_values.shape[-1]] = first_values
+            zeros = np.zeros(first_values.shape[:-1] + (1,))
+            self._sums = zeros
+            self._squares = zeros.copy()
+            self._minima = [np.empty(first_values.shape[:-1] + (0,))]
+            self._maxima = [np.empty(first_values.shape[:-1] + (0,))]
+            end_i = length
+        elif length > self._length:
+            # Dopisane punkty, a także dotychczasowy ostatni, niepełny
+            # blok
+            begin_i = min(begin_i, self._length)
+            end_i = length
+        self._length = length
+        # Sumy prefiksowe zmieniają się od begin_i do końca
+        self._sums = self._grown(self._sums, length+1)
+        self._squares = self._grown(self._squares, length+1)
+        values = self._values(begin_i, length) - self._shift
+        self._sums[..., begin_i+1:length+1] = (
+            self._sums[..., begin_i:begin_i+1] + np.cumsum(values, axis=-1))
+        self._squares[..., begin_i+1:length+1] = (
+            self._squares[..., begin_i:begin_i+1]
+            + np.cumsum(values**2, axis=-1))
+        # Bloki tylko na zmienionym zakresie
+        self._block_count = -(-length // self.block_size)
+        first_block = begin_i // self.block_size
+        last_block = min(-(-end_i // self.block_size), self._block_count)
+        values = self._values(first_block*self.block_size,
+                              min(last_block*self.block_size, length))
+        self._minima[0] = self._grown(self._minima[0], self._block_count)
+        self._maxima[0] = self._grown(self._maxima[0], self._block_count)
+        self._minima[0][..., first_block:last_block] = (
+            self._block_reduce(values, np.min, np.inf))
+        self._maxima[0][..., first_block:last_block] = (
+            self._block_reduce(values, np.max, -np.inf))
+        self._update_tables(first_block, last_block)
+        self._dirty = None
+
+    def _block_reduce(self, values, function, fill_value):
+        """Zwraca minima/maksima kolejnych bloków danych wartości."""
+        padding = -values.shape[-1] % self.block_size
+        pad_width = [(0, 0)] * (values.ndim-1) + [(0, padding)]
+        values = np.pad(values, pad_width, constant_values=fill_value)
+        return function(values.reshape(values.shape[:-1]
+                                       + (-1, self.block_size)), axis=-1)
+
+    def _update_tables(self, first_block, last_block):
+        """Uaktualnia poziomy tablicy rzadkiej zależne od bloków
+        z zakresu <first_block; last_block).
+        """
+        block_count = self._block_count
+        level = 1
+        while 2**level <= block_count:
+            half = 2**(level-1)
+            level_length = block_count - 2**level + 1
+            begin = max(first_block - 2**level + 1, 0)
+            end = min(last_block, level_length)
+            for tables, function in [(self._minima, np.minimum),
+                                     (self._maxima, np.maximum)]:
+                previous = tables[level-1]
+                if len(tables) == level:
+                    tables.append(function(previous[..., :level_length],
+                                           previous[..., half:
+                                                    level_length+half]))
+                elif begin < end:
+                    tables[level] = self._grown(tables[level], level_length)
+                    tables[level][..., begin:end] = function(
+                        previous[..., begin:end],
+                        previous[..., begin+half:end+half])
+            level += 1
+
+    def _reduce(self, begin_i, end_i, function):
+        if end_i <= begin_i:
+            raise ValueError('Pusty zakres danych')
+        self._refresh()
+        tables = self._minima if function is np.minimum else self._maxima
+        first_block = -(-begin_i // self.block_size)
+        last_block = end_i // self.block_size
+        if first_block >= last_block:
+            return function.reduce(self._values(begin_i, end_i), axis=-1)
+        # Cały ciąg bloków odczytujemy z tablicy rzadkiej, a wystające
+        # poza nie końce zakresu bezpośrednio z danych
+        level = int(np.log2(last_block-first_block))
+        result = function(tables[level][..., first_block],
+                          tables[level][..., last_block - 2**level])
+        if begin_i < first_block*self.block_size:
+            result = function(result, function.reduce(
+                self._values(begin_i, first_block*self.block_size), axis=-1))
+        if last_block*self.block_size < end_i:
+            result = function(result, function.reduce(
+                self._values(last_block*self.block_size, end_i), axis=-1))
+        return result
+
+    def sum(self, begin_i, end_i):
+        if end_i <= begin_i:
+            raise ValueError('Pusty zakres danych')
+        self._refresh()
+        return (self._sums[..., end_i] - self._sums[..., begin_i]
+                + (end_i-begin_i) * self._shift[..., 0])
+
+    def mean(self, begin_i, end_i):
+        return self.sum(begin_i, end_i) / (end_i-begin_i)
+
+    def var(self, begin_i, end_i):
+        if end_i <= begin_i:
+            raise ValueError('Pusty zakres danych')
+        self._refresh()
+        # Wariancja nie zależy od przesunięcia wartości
+        count = end_i - begin_i
+        mean = (self._sums[..., end_i] - self._sums[..., begin_i]) / count
+        squares_mean = ((self._squares[..., end_i]
+                         - self._squares[..., begin_i]) / count)
+        return np.maximum(squares_mean - mean**2, 0)
+
+    def min(self, begin_i, end_i):
+        return self._reduce(begin_i, end_i, np.minimum)
+
+    def max(self, begin_i, end_i):
+        return self._reduce(begin_i, end_i, np.maximum)
+
+def _read_only(data):
+    """Zwraca widok tablicy tylko do odczytu."""
+    if isinstance(data, _ChunkedData):
+        return data.read_only()
+    view = data.view()
+    view.flags.writeable = False
+    return view
+
+# Źródło numerów wersji danych; kolejne zmiany dostają coraz większe
+# numery
+_version_counter = itertools.count(1)
+
+class SnapshotError(Exception):
+    """Próba modyfikacji migawki danych (patrz snapshot)."""
+
+class _VersionedData():
+    """Część wspólna Wave, Points i Parameter: numer wersji danych,
+    rosnący przy każdej zmianie, powiadamianie obserwatorów (np.
+    Composite_data, które je przechowuje) o zmianach oraz migawki
+    danych (snapshot).
+    """
+
+    # Wersja początkowa; konstruktory mogą ją już podnieść (np. 
+    # ustawiając offset), więc wersję należy jedynie porównywać 
+    # z wcześniej odczytaną, a nie z 0
+    version = 0
+    # Migawki nie mogą być modyfikowane
+    frozen = False
+
+    def _add_listener(self, listener):
+        """Rejestruje obiekt, którego metoda _member_changed ma być
+        wywoływana przy każdej zmianie danych. Obserwatorzy trzymani są
+        przez słabe referencje.
+        """
+        listeners = self.__dict__.get('_listeners')
+        if listeners is None:
+            listeners = weakref.WeakSet()
+            self._listeners = listeners
+        listeners.add(listener)
+
+    def _remove_listener(self, listener):
+        listeners = self.__dict__.get('_listeners')
+        if listeners is not None:
+            listeners.discard(listener)
+
+    def _changed(self):
+        """Nadaje danym nową wersję i powiadamia obserwatorów. 
+        Wywoływane przez każdą operację zmieniającą dane lub ich 
+        położenie w czasie.
+        """
+        # Wersja rośnie również dla obiektów wczytanych z pickle, 
+        # których numer wersji mógł pochodzić z innego procesu
+        self.version = max(self.version+1, next(_version_counter))
+        for listener in list(self.__dict__.get('_listeners', ())):
+            listener._member_changed(self)
+
+    def _check_writable(self):
+        """Wywoływane przed każdą operacją zmieniającą dane."""
+        if self.frozen:
+            raise SnapshotError('Migawka danych nie może być modyfikowana')
+
+    def snapshot(self):
+        """Zwraca niezmienną migawkę obecnego stanu danych, o tej samej
+        wersji. Migawka współdzieli tablice z oryginałem (copy-on-write,
+        jak copy), więc jest tania, a późniejsze zmiany oryginału nie są
+        w niej widoczne. Dopóki dane się nie zmienią, kolejne wywołania
+        zwracają tę samą migawkę.
+
+        Points współdzielą z migawką bloki punktów, więc zmiana kopiuje
+        tylko zmieniane bloki. Wave współdzieli natomiast całą tablicę 
+        Wave.data: pierwsza zmiana oryginału (replace_slice) po 
+        utworzeniu migawki kopiuje całe dane, a np.memmap zostaje przy
+        tym w całości wczytany do pamięci.
+        Dopisywanie próbek do AppendableWave niczego nie kopiuje, bo
+        trafiają one za koniec danych migawki.
+        """
+        if self.frozen:
+            return self
+        cached = self.__dict__.get('_last_snapshot')
+        if cached is not None:
+            version, reference = cached
+            snapshot = reference()
+            if snapshot is not None and version == self.version:
+                return snapshot
+        snapshot = self._snapshot()
+        snapshot.version = self.version
+        snapshot.frozen = True
+        # Słaba referencja - nieużywana już migawka nie powinna 
+        # wymuszać kopiowania danych przy następnej zmianie
+        self.__dict__['_last_snapshot'] = (self.version, 
+                                           weakref.ref(snapshot))
+        return snapshot
+
+    def _snapshot(self):
+        return self.copy()
+
+class Wave(_VersionedData):
     """Klasa symbolizująca przebieg sygnału. Może być on przesunięty w 
     czasie i nie zaczynać się od 0. W takim wypadku wszystkie odwołania 
     do jego wartości w danym czasie uwzględnią to przesunięcie.
 
     Atrybuty:
-        Wave.data - tablica wartości y punktów przebiegu
+        Wave.data - tablica wartości y punktów przebiegu; może to być
+                    dowolna tablica numpy, również np.memmap pliku na
+                    dysku, która nie jest kopiowana do pamięci. Kolejne
+                    punkty leżą wzdłuż ostatniej osi tablicy (patrz
+                    MultiChannelWave)
         Wave.complete_length - długość przebiegu w czasie
         Wave.sample_length - długość jednego sampla
         Wave.sample_rate - częstotliwość samplowania
         Wave.wave_type - typ danych przebiegu, np. 'ecg' czy 'bp'
         Wave.offset - przesunięcie w czasie w Composite_data
+        Wave.version - numer wersji danych, rośnie przy każdej zmianie
+                       danych (replace_slice) lub offsetu
+        Wave.value_scale, Wave.value_offset - współczynniki, za pomocą
+                    których zapisane w Wave.data wartości przeliczane
+                    są na jednostki fizyczne:
+                    data * value_scale + value_offset
     """
 
-    def __init__(self, data, complete_length, wave_type, offset=0):
+    # Domyślnie wartości w Wave.data są już w jednostkach fizycznych
+    value_scale = 1
+    value_offset = 0
+    # Największy mianownik przybliżenia stosunku częstotliwości przy
+    # przepróbkowaniu polifazowym (patrz resampled)
+    max_resample_factor = 100
+    # Przy zapisie w typie całkowitym (patrz astype) wartości przebiegu
+    # zajmują 1/integer_headroom zakresu typu, by późniejsze wartości
+    # spoza obecnego zakresu (np. przeregulowanie po filtracji) nie
+    # były przycinane
+    integer_headroom = 2
+
+    def __init__(self, data, complete_length, wave_type, offset=0,
+                 value_scale=1, value_offset=0):
         """Inicjalizuje Wave. Przyjmuje tablicę danych wartości
         sygnału oraz jego długość, a także typ (np. 'bp').
+
+        Jeśli data jest już tablicą numpy (np. np.memmap) lub innym
+        buforem, to nie jest ona kopiowana - Wave korzysta z niej
+        bezpośrednio. Jeśli data zawiera surowe wartości (np. int16 z
+        przetwornika), value_scale i value_offset określają ich
+        przeliczenie na jednostki fizyczne.
         """
+        if not isinstance(data, _LazyArray):
+            data = np.asarray(data)
+        self.data = data
         # Okres nagranych danych; odległość w czasie między
         # punktami przebiegu.
-        self.sample_length = complete_length/len(data)
+        self.sample_length = complete_length/self.data.shape[-1]
         # Częstotliwość danych.
         self.sample_rate = 1/self.sample_length        
         self.complete_length = complete_length 
         self.type = wave_type 
-        self.data = np.array(data) 
         self.offset = offset
+        self.value_scale = value_scale
+        self.value_offset = value_offset
 
     @classmethod
     def fromWave(cls, wave):
-        """Zwraca kopię danego Wave."""
-        return cls(wave.data, wave.complete_length,
-                   wave_type=wave.type, offset=wave.offset)
+        """Zwraca kopię danego Wave. Kopia współdzieli tablicę danych
+        z oryginałem, dopóki któryś z nich nie zostanie zmodyfikowany
+        (copy-on-write).
+        """
+        out = cls(wave.data, wave.complete_length,
+                  wave_type=wave.type, offset=wave.offset,
+                  value_scale=wave.value_scale,
+                  value_offset=wave.value_offset)
+        out._share_data(wave)
+        out.version = wave.version
+        return out
 
     def copy(self):
         return Wave.fromWave(self)
 
+    def _snapshot(self):
+        """Nadpisuje _VersionedData._snapshot. Dane migawki, a do 
+        pierwszej zmiany również dane oryginału, są widokami tylko do
+        odczytu, więc także bezpośredni zapis do Wave.data nie zmieni
+        migawki.
+        """
+        snapshot = self.copy()
+        snapshot.data = _read_only(self.data)
+        if isinstance(self.data, np.ndarray) and self.data.flags.writeable:
+            # Zapisywalna tablica przywracana jest przez _own_data
+            self._writable_data = self.data
+            self.data = _read_only(self.data)
+        return snapshot
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @offset.setter
+    def offset(self, offset):
+        self._check_writable()
+        self._offset = offset
+        self._changed()
+
+    def time_span(self):
+        """Zwraca początek i koniec przebiegu w czasie."""
+        return self.offset, self.offset + self.complete_length
+
+    def coverage(self):
+        """Zwraca tablice początków i końców przedziałów czasu, na 
+        których przebieg ma dane (bez przerw w próbkowaniu).
+        """
+        begin_time, end_time = self.time_span()
+        return np.array([begin_time]), np.array([end_time])
+
+    def window(self, begin_time, end_time):
+        """Zwraca Wave obejmujący zakres czasu <begin_time; end_time>,
+        którego dane są widokiem danych self (bez kopiowania, 
+        współdzielonym do pierwszej modyfikacji). Czasy w zwróconym 
+        Wave są takie same jak w self, a zawiera on wszystkie punkty
+        potrzebne do odczytania wartości w tym zakresie, również
+        interpolowanych. Jeśli zakres nie obejmuje żadnego punktu, 
+        zwraca None.
+        """
+        approx_indices = self._approx_indices(
+            np.array([begin_time, end_time], dtype=float))
+        begin_i = int(np.clip(np.floor(approx_indices[0]), 0, len(self)))
+        end_i = int(np.clip(np.ceil(approx_indices[1])+1, 0, len(self)))
+        if end_i <= begin_i:
+            return None
+        out = self._window(begin_i, end_i)
+        out._share_data(self)
+        out.version = self.version
+        return out
+
+    def sliding_windows(self, begin_times, size):
+        """Zwraca tablicę wartości (w jednostkach fizycznych) okien
+        o długości size sekund zaczynających się w danych czasach,
+        o wymiarach (okna x punkty okna); dla MultiChannelWave
+        (kanały x okna x punkty okna).
+
+        Jeśli okna są równomiernie rozłożone co całkowitą liczbę
+        punktów, a dane nie wymagają przeliczenia (value_scale 1, 
+        value_offset 0), to zwracany jest widok Wave.data tylko do
+        odczytu, bez kopiowania danych. Jeśli Wave.data nie jest 
+        tablicą numpy (np. w WaveExpression), okna odczytywane są 
+        tylko w żądanych punktach.
+        """
+        window_length, starts = self._window_starts(begin_times, size)
+        if isinstance(self.data, _LazyArray):
+            values = self._decode(
+                self.data[..., starts[:, None] + np.arange(window_length)])
+            values.flags.writeable = False
+            return values
+        windows = np.lib.stride_tricks.sliding_window_view(
+            self.data, window_length, axis=-1)
+        steps = np.diff(starts)
+        if len(starts) == 0:
+            windows = windows[..., :0, :]
+        elif len(starts) == 1:
+            windows = windows[..., starts[0]:starts[0]+1, :]
+        elif np.all(steps == steps[0]) and steps[0] > 0:
+            windows = windows[..., starts[0]:starts[-1]+1:steps[0], :]
+        else:
+            windows = windows[..., starts, :]
+        return self._decode(windows)
+
+    def _window_starts(self, begin_times, size):
+        """Zwraca liczbę punktów okna o długości size sekund oraz
+        tablicę indeksów pierwszych punktów okien zaczynających się 
+        w danych czasach. Jeśli któreś okno wystaje poza ramy czasowe
+        danych, powoduje ValueError.
+        """
+        window_length = int(round(size / self.sample_length))
+        if window_length > len(self):
+            raise ValueError('Okno jest dłuższe niż przebieg')
+        begin_times = np.asarray(begin_times, dtype=float)
+        starts = self.sample_at_many(begin_times)
+        self.sample_at_many(begin_times + size)
+        # Poprawka na zaokrąglenie okna kończącego się na końcu danych
+        return window_length, np.minimum(starts, len(self)-window_length)
+
+    def _window(self, begin_i, end_i):
+        """Tworzy Wave z punktów o indeksach <begin_i; end_i)."""
+        return Wave(self.data[..., begin_i:end_i], 
+                    (end_i-begin_i) * self.sample_length, self.type,
+                    offset=self.offset + begin_i*self.sample_length,
+                    value_scale=self.value_scale,
+                    value_offset=self.value_offset)
+
+    def astype(self, dtype, value_scale=None, value_offset=None):
+        """Zwraca kopię Wave, którego dane przechowywane są w danym
+        typie, np. 'float32' lub 'int16'. Dla typów całkowitych, jeśli
+        value_scale i value_offset nie są podane, dobierane są tak, by
+        zakres wartości przebiegu wykorzystywał 1/integer_headroom 
+        zakresu typu. Wartości, które mimo to wykraczają poza zakres 
+        typu, są przycinane z ostrzeżeniem RuntimeWarning.
+        """
+        dtype = np.dtype(dtype)
+        values = self._decode(np.asarray(self.data))
+        if np.issubdtype(dtype, np.integer):
+            if value_scale is None or value_offset is None:
+                dtype_info = np.iinfo(dtype)
+                min_value = np.min(values)
+                max_value = np.max(values)
+                value_offset = (max_value+min_value) / 2
+                value_scale = ((max_value-min_value) * self.integer_headroom
+                               / (int(dtype_info.max)-int(dtype_info.min)))
+                if value_scale == 0:
+                    value_scale = 1
+        else:
+            value_scale = 1
+            value_offset = 0
+        data = _encode_values(values, dtype, value_scale, value_offset)
+        return Wave(data, self.complete_length, self.type,
+                    offset=self.offset,
+                    value_scale=value_scale, value_offset=value_offset)
+
+    def _decode(self, data):
+        """Przelicza zapisane wartości na jednostki fizyczne."""
+        if self.value_scale == 1 and self.value_offset == 0:
+            return data
+        return data*self.value_scale + self.value_offset
+
+    def _encode(self, values):
+        """Przelicza wartości w jednostkach fizycznych na wartości
+        zapisywane w Wave.data.
+        """
+        return _encode_values(values, self.data.dtype,
+                              self.value_scale, self.value_offset)
+
     def __len__(self):
         """Zwraca liczbę punktów zawartych w całym ciągu danych."""
-        return len(self.data)
+        return self.data.shape[-1]
+
+    # Działania arytmetyczne na przebiegach nie są wykonywane od razu,
+    # lecz tworzą leniwe wyrażenie (patrz WaveExpression)
+    def __add__(self, other):
+        return _combine(np.add, self, other)
+
+    def __radd__(self, other):
+        return _combine(np.add, other, self)
+
+    def __sub__(self, other):
+        return _combine(np.subtract, self, other)
+
+    def __rsub__(self, other):
+        return _combine(np.subtract, other, self)
+
+    def __mul__(self, other):
+        return _combine(np.multiply, self, other)
+
+    def __rmul__(self, other):
+        return _combine(np.multiply, other, self)
+
+    def __truediv__(self, other):
+        return _combine(np.true_divide, self, other)
+
+    def __rtruediv__(self, other):
+        return _combine(np.true_divide, other, self)
+
+    def __pow__(self, other):
+        return _combine(np.power, self, other)
+
+    def __neg__(self):
+        return _combine(np.negative, self)
+
+    def __abs__(self):
+        return _combine(np.absolute, self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_data_sharers', None)
+        state.pop('_range_statistics', None)
+        state.pop('_resampled', None)
+        state.pop('_writable_data', None)
+        state.pop('_listeners', None)
+        state.pop('_last_snapshot', None)
+        return state
+
+    def __setstate__(self, state):
+        # Obsługa Wave zapisanych zanim offset stał się właściwością
+        if 'offset' in state:
+            state['_offset'] = state.pop('offset')
+        self.__dict__.update(state)
+
+    def _share_data(self, wave):
+        """Zaznacza, że self i dany Wave korzystają z tej samej tablicy
+        danych. Zbiór współdzielących ją obiektów jest słaby, więc
+        usunięte kopie nie wymuszają później kopiowania danych.
+        """
+        sharers = wave.__dict__.get('_data_sharers')
+        if sharers is None:
+            sharers = weakref.WeakSet([wave])
+            wave._data_sharers = sharers
+        sharers.add(self)
+        self._data_sharers = sharers
+
+    def _own_data(self):
+        """Zapewnia, że tablica danych nie jest współdzielona z innym
+        Wave; wywoływane przed każdą modyfikacją danych w miejscu.
+        """
+        self._check_writable()
+        sharers = self.__dict__.pop('_data_sharers', None)
+        writable_data = self.__dict__.pop('_writable_data', None)
+        if sharers is not None:
+            sharers.discard(self)
+            if len(sharers) > 0:
+                if isinstance(self.data, _ChunkedData):
+                    self.data = self.data.copy()
+                else:
+                    self.data = np.array(self.data)
+        # Dane zablokowane przez migawkę, która już nie istnieje
+        if (writable_data is not None and not self.data.flags.writeable
+                and np.shares_memory(self.data, writable_data)):
+            self.data = writable_data
+        # Wartości wyrażenia (patrz WaveExpression) nie mogą być
+        # zmieniane w miejscu, więc najpierw obliczamy je w całości
+        if isinstance(self.data, _ExpressionData):
+            self.data = np.array(self.data)
+
+    def _approx_indices(self, times):
+        """Zwraca ułamkowe indeksy punktów przebiegu odpowiadające
+        danym czasom.
+        """
+        return (times-self.offset) / self.sample_length
 
     def sample_at(self, time):
         """Zwraca index najbliższego punktu do podanego czasu.  
         Jeśli index wystaje poza ramy czasowe danych to metoda 
         powoduje ValueError.
         """
-        index = round((time-self.offset) / self.sample_length)
+        index = round(self._approx_indices(time))
         # Poprawka na ostatni punkt wykresu
         if index == len(self):
             index -= 1
@@ -73,21 +656,59 @@ class Wave():
                              'czasowy danych' % time)
         return int(index)
     
+    def sample_at_many(self, times):
+        """Zwraca tablicę indeksów najbliższych punktów do podanych
+        czasów. Działa jak sample_at, ale dla całej tablicy czasów
+        naraz. Jeśli którykolwiek index wystaje poza ramy czasowe
+        danych to metoda powoduje ValueError.
+        """
+        times = np.asarray(times, dtype=float)
+        indices = np.rint(self._approx_indices(times))
+        # Poprawka na ostatni punkt wykresu
+        indices[indices == len(self)] -= 1
+        outside = (indices < 0) | (indices > len(self))
+        if np.any(outside):
+            raise ValueError('Punkt o żądanym czasie %s wystaje poza zakres '
+                             'czasowy danych' % times[outside][0])
+        return indices.astype(int)
+
     def value_at(self, time):
         """Zwraca wartość przebiegu w danym punkcie obliczoną za 
         pomocą interpolacji liniowej sąsiednich dwóch punktów.  Jeśli
         żądany punkt wystaje poza ramy czasowe posiadanych danych to 
         metoda wywołuje ValueError.
         """
-        approx_index = (time-self.offset) / self.sample_length
-        interp_index = int(approx_index)
-        if interp_index < 0 or interp_index >= len(self)-1:
+        # [()] zamienia wynik dla jednokanałowych danych w liczbę
+        return self.value_at_many([time])[..., 0][()]
+
+    def value_at_many(self, times):
+        """Zwraca tablicę wartości przebiegu w podanych punktach czasu,
+        obliczonych za pomocą interpolacji liniowej sąsiednich dwóch
+        punktów. Poprawność zakresu sprawdzana jest raz dla całej
+        tablicy; jeśli którykolwiek punkt wystaje poza ramy czasowe
+        posiadanych danych to metoda wywołuje ValueError.
+        """
+        times = np.asarray(times, dtype=float)
+        approx_indices = self._approx_indices(times)
+        outside = (approx_indices < 0) | (approx_indices > len(self)-1)
+        if np.any(outside):
             raise ValueError('Punkt o żądanym czasie %s wystaje poza zakres '
-                             'czasowy danych' % time)
-        approx_value = np.interp(
-            approx_index, [interp_index, interp_index+1], 
-            [self.data[interp_index],  self.data[interp_index+1]])
-        return self.data[self.sample_at(time)]
+                             'czasowy danych' % times[outside][0])
+        return self._interpolate(approx_indices)
+
+    def _interpolate(self, approx_indices):
+        """Zwraca wartości przebiegu w danych ułamkowych indeksach
+        obliczone za pomocą interpolacji liniowej. Indeksy spoza
+        zakresu danych są przycinane do pierwszego/ostatniego punktu.
+        """
+        approx_indices = np.clip(approx_indices, 0, len(self)-1)
+        # Odczytujemy tylko po dwa sąsiednie punkty dla każdego czasu
+        interp_indices = np.minimum(approx_indices.astype(int),
+                                    max(len(self)-2, 0))
+        next_indices = np.minimum(interp_indices+1, len(self)-1)
+        fractions = approx_indices - interp_indices
+        return self._decode(self.data[..., interp_indices] * (1-fractions)
+                            + self.data[..., next_indices] * fractions)
     
     def data_slice(self, begin_time, end_time, 
                    value_every=0, value_count=None):
@@ -96,6 +717,12 @@ class Wave():
         bazowa, to  zwrócony ciąg jest wynikiem interpolacji liniowej 
         posiadanych już danych.
 
+        Wartości zwracane są zawsze w jednostkach fizycznych. Przy
+        częstotliwości bazowej i danych zapisanych bez przeliczania
+        (value_scale 1, value_offset 0) zwracany jest widok Wave.data
+        tylko do odczytu, bez kopiowania danych. Jeśli wynik ma być
+        modyfikowany, należy go najpierw skopiować.
+
         Argumenty:
         begin_time - początek zakresu
         end_time - koniec zakresu
@@ -114,16 +741,47 @@ class Wave():
         if value_count is not None:
             value_every = (end_time-begin_time)/value_count
         if value_every == 0 or isclose(self.sample_length, value_every):
-           return self.data[begin_i:end_i]
+            data_view = self.data[..., begin_i:end_i]
+            data_view.flags.writeable = False
+            return self._decode(data_view)
         # Jeśli żądana częstotliwość punktów na wykresie jest inna niż
-        # bazowa, należy przeprowadzadzić interpolacjaę liniową na 
-        # żądanych punktach czasowych
-        wanted_values = np.arange(begin_time, end_time, value_every)
-        coord_x, coord_y = self.generate_coordinate_tables(
-            begin_time = begin_time, end_time = end_time, 
-            begin_x = begin_time)
-        interpolated_table = np.interp(wanted_values, coord_x, coord_y)
-        return interpolated_table
+        # bazowa, obliczamy ułamkowe indeksy żądanych punktów czasowych
+        # i interpolujemy liniowo bezpośrednio na Wave.data
+        if value_count is not None:
+            wanted_times = begin_time + np.arange(value_count)*value_every
+        else:
+            wanted_times = np.arange(begin_time, end_time, value_every)
+        return self._interpolate(self._approx_indices(wanted_times))
+
+    def data_slices(self, begin_times, length,
+                    value_every=0, value_count=None):
+        """Zwraca dwuwymiarową tablicę wartości danych dla wielu
+        okien czasowych o tej samej długości naraz; każdy wiersz
+        odpowiada jednemu oknu. Jeśli żądana częstotliwość jest inna
+        niż bazowa, to wartości są wynikiem interpolacji liniowej.
+
+        Argumenty:
+        begin_times - tablica początków okien
+        length - długość każdego okna w czasie
+        value_every - jak w data_slice
+        value_count - jak w data_slice
+        """
+        begin_times = np.asarray(begin_times, dtype=float)
+        # Sprawdzamy zakres wszystkich okien naraz
+        begin_indices = self.sample_at_many(begin_times)
+        self.sample_at_many(begin_times + length)
+        if value_count is not None:
+            value_every = length/value_count
+        if value_every == 0 or isclose(self.sample_length, value_every):
+            sample_count = int(round(length / self.sample_length))
+            indices = begin_indices[:, None] + np.arange(sample_count)
+            return self._decode(
+                self.data[..., np.minimum(indices, len(self)-1)])
+        if value_count is None:
+            value_count = len(np.arange(0, length, value_every))
+        wanted_times = (begin_times[:, None]
+                        + np.arange(value_count)*value_every)
+        return self._interpolate(self._approx_indices(wanted_times))
 
     def replace_slice(self, begin_time, end_time, wave):
         """Zastępuje wybrany zakres wartości przebiegu wartościami 
@@ -146,68 +804,1340 @@ class Wave():
                              'do zastąpienia')
         begin_i = self.sample_at(begin_time)
         end_i = self.sample_at(end_time)
-        for j in range(end_i-begin_i):
-            self.data[begin_i+j]=wave.data[j]
+        self._own_data()
+        # Przypisanie całego wycinka naraz - w przypadku np.memmap
+        # dotyka tylko stron pliku z zastępowanego zakresu
+        self.data[..., begin_i:end_i] = self._encode(
+            wave._decode(wave.data[..., :end_i-begin_i]))
+        self._invalidate_statistics(begin_i, end_i)
+        self._changed()
+
+    def grid_range(self, sample_rate):
+        """Zwraca zakres <first_k; end_k) numerów punktów siatki czasu
+        k/sample_rate, które leżą w zakresie czasowym przebiegu.
+        Siatka liczona jest od czasu 0, więc jest wspólna dla
+        wszystkich przebiegów o tej samej docelowej częstotliwości.
+        """
+        begin_time, end_time = self.time_span()
+        # Tolerancja na błędy zaokrągleń czasów leżących na siatce
+        return (int(np.ceil(begin_time*sample_rate - 1e-9)),
+                int(np.ceil(end_time*sample_rate - 1e-9)))
+
+    def resampled(self, sample_rate, first_k=None, end_k=None,
+                  method='poly'):
+        """Zwraca wartości przebiegu przepróbkowanego do punktów siatki
+        czasu k/sample_rate dla k z zakresu <first_k; end_k) - 
+        domyślnie całego zakresu przebiegu (patrz grid_range).
+
+        Wynik dla całego przebiegu jest zapamiętywany dla danej 
+        częstotliwości i metody, aż do zmiany wersji przebiegu. 
+        Fragmenty są wtedy wycinane z zapamiętanej tablicy; w przeciwnym
+        razie liczone są osobno i nie są zapamiętywane, co pozwala 
+        przetwarzać długie nagrania kawałkami. Zwrócona tablica jest 
+        tylko do odczytu.
+
+        Argumenty:
+        method - 'poly' - przy zmniejszaniu częstotliwości przepróbkowanie
+                          polifazowe z filtrem antyaliasingowym
+                          (scipy.signal.resample_poly), a następnie
+                          interpolacja liniowa do punktów siatki
+                 'linear' - interpolacja liniowa, jak w data_slice
+        """
+        if method not in ('poly', 'linear'):
+            raise ValueError('Nieznana metoda przepróbkowania %s' % method)
+        grid_begin, grid_end = self.grid_range(sample_rate)
+        if first_k is None:
+            first_k = grid_begin
+        if end_k is None:
+            end_k = grid_end
+        cache = self.__dict__.setdefault('_resampled', {})
+        version, cached_begin, values = cache.get((sample_rate, method),
+                                                  (None, None, None))
+        if version == self.version:
+            if first_k < grid_begin or end_k > grid_end:
+                raise ValueError('Zakres siatki wystaje poza zakres '
+                                 'czasowy danych')
+            return values[..., first_k-cached_begin:end_k-cached_begin]
+        values = self._resample_range(sample_rate, first_k, end_k, method)
+        values.flags.writeable = False
+        if first_k == grid_begin and end_k == grid_end:
+            cache[(sample_rate, method)] = (self.version, first_k, values)
+        return values
+
+    def _resample_range(self, sample_rate, first_k, end_k, method):
+        """Oblicza wartości przebiegu w punktach siatki k/sample_rate
+        dla k z zakresu <first_k; end_k) (patrz resampled).
+        """
+        grid_begin, grid_end = self.grid_range(sample_rate)
+        if first_k < grid_begin or end_k > grid_end:
+            raise ValueError('Zakres siatki wystaje poza zakres '
+                             'czasowy danych')
+        approx_indices = self._approx_indices(
+            np.arange(first_k, end_k) / sample_rate)
+        if (method == 'linear' or sample_rate >= self.sample_rate
+                or len(approx_indices) == 0):
+            return self._interpolate(approx_indices)
+        from scipy.signal import resample_poly
+        ratio = Fraction(sample_rate/self.sample_rate).limit_denominator(
+            self.max_resample_factor)
+        up, down = ratio.numerator, ratio.denominator
+        # Filtr resample_poly sięga 10*max(up, down) punktów nadpróbkowanego
+        # ciągu; wczytujemy tyle punktów zapasu z obu stron fragmentu,
+        # a poza danymi powtarzamy ich skrajne wartości. Początek 
+        # zaokrąglamy do wielokrotności down, więc wynik nie zależy od
+        # podziału zakresu na fragmenty (dopełnienie zerami przez
+        # resample_poly dotyczy tylko nieużywanego zapasu).
+        margin = 10*max(up, down)//up + 2
+        begin_i = (int(np.floor(approx_indices[0])) - margin) // down * down
+        end_i = int(np.ceil(approx_indices[-1])) + margin + 1
+        values = self._decode(
+            self.data[..., max(begin_i, 0):min(end_i, len(self))])
+        padding = (max(-begin_i, 0), max(end_i-len(self), 0))
+        if padding != (0, 0):
+            values = np.pad(values, [(0, 0)]*(values.ndim-1) + [padding],
+                            mode='edge')
+        values = resample_poly(values, up, down, axis=-1, 
+                               padtype='constant')
+        # Interpolacja liniowa z punktów przepróbkowanego ciągu, 
+        # leżących w odstępach down/up punktów przebiegu
+        positions = np.clip((approx_indices-begin_i) * up/down,
+                            0, values.shape[-1]-1)
+        previous = np.minimum(positions.astype(int),
+                              max(values.shape[-1]-2, 0))
+        following = np.minimum(previous+1, values.shape[-1]-1)
+        fractions = positions - previous
+        return (values[..., previous] * (1-fractions)
+                + values[..., following] * fractions)
+
+    def _statistics(self):
+        """Zwraca indeks statystyk zakresowych, tworząc go przy
+        pierwszym użyciu.
+        """
+        statistics = self.__dict__.get('_range_statistics')
+        if statistics is None:
+            statistics = _RangeStatistics(self)
+            self._range_statistics = statistics
+        return statistics
+
+    def _invalidate_statistics(self, begin_i, end_i):
+        """Informuje indeks statystyk zakresowych (jeśli istnieje)
+        o zmianie punktów z zakresu <begin_i; end_i).
+        """
+        statistics = self.__dict__.get('_range_statistics')
+        if statistics is not None:
+            statistics.invalidate(begin_i, end_i)
+
+    def range_sum(self, begin_time, end_time):
+        """Zwraca sumę wartości przebiegu w zakresie czasu
+        <begin_time; end_time). Korzysta z indeksu statystyk
+        zakresowych, więc działa w czasie O(1).
+        """
+        return self._statistics().sum(self.sample_at(begin_time),
+                                      self.sample_at(end_time))
+
+    def range_mean(self, begin_time, end_time):
+        """Zwraca średnią wartości przebiegu w zakresie czasu
+        <begin_time; end_time) w czasie O(1).
+        """
+        return self._statistics().mean(self.sample_at(begin_time),
+                                       self.sample_at(end_time))
+
+    def range_var(self, begin_time, end_time):
+        """Zwraca wariancję wartości przebiegu w zakresie czasu
+        <begin_time; end_time) w czasie O(1).
+        """
+        return self._statistics().var(self.sample_at(begin_time),
+                                      self.sample_at(end_time))
+
+    def range_min(self, begin_time, end_time):
+        """Zwraca najmniejszą wartość przebiegu w zakresie czasu
+        <begin_time; end_time) w czasie O(1).
+        """
+        return self._statistics().min(self.sample_at(begin_time),
+                                      self.sample_at(end_time))
+
+    def range_max(self, begin_time, end_time):
+        """Zwraca największą wartość przebiegu w zakresie czasu
+        <begin_time; end_time) w czasie O(1).
+        """
+        return self._statistics().max(self.sample_at(begin_time),
+                                      self.sample_at(end_time))
     
     def generate_coordinate_tables(self, begin_time=0, end_time=None,
                                    begin_x=0):
         """Zwraca wszystkie punkty przebiegu w formie dwóch tablic - 
         wartości x oraz wartości y. Przydatne do wizualizacji.
+        Tablica y jest widokiem danych przebiegu (bez kopiowania),
+        a tablica x jest wyliczana arytmetycznie.
 
         Argumenty:
         begin_time - początek zakresu czasowego punktów do zwrócenia 
                      w tablicy
         end_time - koniec zakresu czasowego punktów do zwrócenia w 
-                   tablicy
+                   tablicy; jeśli None, to koniec przebiegu
         begin_x - wartość x pierwszego punktu na tablicy
         """
-        data = self.data_slice(begin_time, end_time)
-        output_x = []
-        output_y = []
-        for i in range(len(data)):
-            output_x.append(begin_x+i * self.sample_length)
-            output_y.append(data[i])
-        output_x = np.array(output_x)
-        output_y = np.array(output_y)
+        if end_time is None:
+            end_time = self.offset + self.complete_length
+        output_y = self.data_slice(begin_time, end_time)
+        output_x = (begin_x
+                    + np.arange(output_y.shape[-1]) * self.sample_length)
+        return output_x, output_y
+
+class MultiChannelWave(Wave):
+    """Wave zawierający kilka kanałów (np. odprowadzeń EKG) o wspólnej
+    podstawie czasu. Dane przechowywane są w jednej tablicy o wymiarach
+    (kanały x punkty), a wszystkie metody Wave działają na wszystkich
+    kanałach naraz - np. data_slice zwraca tablicę (kanały x punkty).
+
+    Atrybuty:
+        MultiChannelWave.channel_names - lista nazw kanałów
+    """
+
+    def __init__(self, data, complete_length, wave_type, offset=0,
+                 channel_names=None, value_scale=1, value_offset=0):
+        """Inicjalizuje MultiChannelWave. Przyjmuje dwuwymiarową
+        tablicę danych (kanały x punkty), długość przebiegu, jego typ
+        oraz opcjonalnie nazwy kanałów.
+        """
+        super().__init__(data, complete_length, wave_type, offset=offset,
+                         value_scale=value_scale, value_offset=value_offset)
+        if self.data.ndim != 2:
+            raise ValueError('Dane MultiChannelWave muszą mieć wymiary '
+                             '(kanały x punkty)')
+        if channel_names is None:
+            channel_names = list(range(len(self.data)))
+        if len(channel_names) != len(self.data):
+            raise ValueError('Liczba nazw kanałów niezgodna z liczbą '
+                             'kanałów danych')
+        self.channel_names = list(channel_names)
+
+    @classmethod
+    def fromWaves(cls, waves, wave_type):
+        """Tworzy MultiChannelWave z dict Wave o tej samej długości,
+        częstotliwości i przesunięciu w czasie; klucze dict stają się
+        nazwami kanałów.
+        """
+        first = next(iter(waves.values()))
+        for wave in waves.values():
+            if (len(wave) != len(first)
+                    or not isclose(wave.sample_length, first.sample_length)
+                    or not isclose(wave.offset, first.offset)):
+                raise ValueError('Przebiegi nie mają wspólnej podstawy '
+                                 'czasu')
+        data = np.vstack([wave._decode(np.asarray(wave.data))
+                          for wave in waves.values()])
+        return cls(data, first.complete_length, wave_type,
+                   offset=first.offset, channel_names=list(waves.keys()))
+
+    def copy(self):
+        out = MultiChannelWave(self.data, self.complete_length, self.type,
+                               offset=self.offset,
+                               channel_names=self.channel_names,
+                               value_scale=self.value_scale,
+                               value_offset=self.value_offset)
+        out._share_data(self)
+        out.version = self.version
+        return out
+
+    def _window(self, begin_i, end_i):
+        """Nadpisuje Wave._window."""
+        return MultiChannelWave(self.data[:, begin_i:end_i],
+                                (end_i-begin_i) * self.sample_length,
+                                self.type,
+                                offset=self.offset 
+                                       + begin_i*self.sample_length,
+                                channel_names=self.channel_names,
+                                value_scale=self.value_scale,
+                                value_offset=self.value_offset)
+
+    def channel(self, channel_name):
+        """Zwraca Wave jednego kanału. Jego dane są widokiem danych
+        MultiChannelWave, współdzielonym do pierwszej modyfikacji.
+        """
+        index = self.channel_names.index(channel_name)
+        out = Wave(self.data[index], self.complete_length, channel_name,
+                   offset=self.offset, value_scale=self.value_scale,
+                   value_offset=self.value_offset)
+        out._share_data(self)
+        return out
+
+class IrregularWave(Wave):
+    """Wave, którego punkty nie są rozłożone równomiernie w czasie
+    (np. z powodu zgubionych pakietów danych). Przechowuje posortowaną
+    tablicę czasów wszystkich punktów.
+
+    Przebieg dzielony jest na odcinki rozdzielone przerwami. Na
+    odcinkach o regularnym próbkowaniu indeksy punktów obliczane są
+    arytmetycznie, a na pozostałych za pomocą wyszukiwania binarnego
+    w tablicy czasów.
+
+    Atrybuty:
+        IrregularWave.timestamps - czasy punktów względem Wave.offset
+        IrregularWave.sample_length - typowa (mediana) odległość
+                                      w czasie między punktami
+    """
+
+    # Maksymalne odchylenie czasów punktów od siatki (jako ułamek
+    # sample_length), przy którym odcinek uznawany jest za regularny
+    regular_tolerance = 0.01
+
+    def __init__(self, data, timestamps, wave_type, offset=0,
+                 value_scale=1, value_offset=0, tolerance=0.25,
+                 sample_length=None):
+        """Inicjalizuje IrregularWave. Przyjmuje tablicę danych
+        wartości sygnału, rosnącą tablicę czasów odpowiadających im
+        punktów oraz typ (np. 'bp').
+
+        Argumenty:
+        tolerance - odchylenie odległości między sąsiednimi punktami
+                    od sample_length (jako ułamek sample_length),
+                    powyżej którego uznawana jest ona za przerwę
+        sample_length - typowa odległość między punktami; domyślnie
+                        mediana odległości, która wymaga co najmniej
+                        dwóch punktów
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        differences = np.diff(timestamps)
+        if np.any(differences <= 0):
+            raise ValueError('Czasy punktów muszą być rosnące')
+        if sample_length is None:
+            if len(differences) == 0:
+                raise ValueError('IrregularWave bez podanego sample_length '
+                                 'wymaga co najmniej dwóch punktów')
+            sample_length = np.median(differences)
+        super().__init__(data, timestamps[-1]+sample_length, wave_type,
+                         offset=offset, value_scale=value_scale,
+                         value_offset=value_offset)
+        if len(timestamps) != len(self):
+            raise ValueError('Liczba czasów niezgodna z liczbą punktów')
+        self.timestamps = timestamps
+        self.sample_length = sample_length
+        self.sample_rate = 1/sample_length
+        self.tolerance = tolerance
+        self._find_segments()
+
+    def _find_segments(self):
+        """Dzieli przebieg na odcinki rozdzielone przerwami
+        i sprawdza, które z nich są próbkowane regularnie.
+        """
+        timestamps = self.timestamps
+        gaps = (np.abs(np.diff(timestamps)-self.sample_length)
+                > self.tolerance*self.sample_length)
+        begins = np.concatenate(([0], np.flatnonzero(gaps)+1))
+        ends = np.concatenate((begins[1:]-1, [len(timestamps)-1]))
+        steps = np.full(len(begins), self.sample_length)
+        longer = ends > begins
+        steps[longer] = ((timestamps[ends[longer]]-timestamps[begins[longer]])
+                         / (ends[longer]-begins[longer]))
+        # Odchylenie każdego punktu od regularnej siatki jego odcinka
+        segment_ids = np.repeat(np.arange(len(begins)), ends-begins+1)
+        predicted = (timestamps[begins][segment_ids]
+                     + (np.arange(len(timestamps))-begins[segment_ids])
+                     * steps[segment_ids])
+        deviations = np.maximum.reduceat(np.abs(timestamps-predicted), begins)
+        self._segment_begins = begins
+        self._segment_ends = ends
+        self._segment_times = timestamps[begins]
+        self._segment_steps = steps
+        self._segment_regular = (deviations
+                                 <= self.regular_tolerance*self.sample_length)
+
+    def copy(self):
+        out = IrregularWave(self.data, self.timestamps, self.type,
+                            offset=self.offset,
+                            value_scale=self.value_scale,
+                            value_offset=self.value_offset,
+                            tolerance=self.tolerance,
+                            sample_length=self.sample_length)
+        out._share_data(self)
+        out.version = self.version
+        return out
+
+    def time_span(self):
+        """Nadpisuje Wave.time_span - przebieg zaczyna się w czasie
+        pierwszego punktu, który nie musi wynosić 0.
+        """
+        return (self.offset + self.timestamps[0], 
+                self.offset + self.complete_length)
+
+    def coverage(self):
+        """Nadpisuje Wave.coverage - przedziały odpowiadają odcinkom
+        rozdzielonym przerwami. Ostatni odcinek kończy się tam, gdzie
+        cały przebieg (patrz time_span).
+        """
+        begins = self.offset + self.timestamps[self._segment_begins]
+        ends = self.offset + self.timestamps[self._segment_ends]
+        ends[-1] = self.offset + self.complete_length
+        return begins, ends
+
+    def _resample_range(self, sample_rate, first_k, end_k, method):
+        """Nadpisuje Wave._resample_range. Przepróbkowanie polifazowe
+        wymaga regularnego próbkowania, więc zawsze stosowana jest
+        interpolacja liniowa.
+        """
+        return super()._resample_range(sample_rate, first_k, end_k,
+                                       'linear')
+
+    def window(self, begin_time, end_time):
+        """Nadpisuje Wave.window. Jeśli okno zawierałoby mniej niż
+        dwa punkty, zwraca None, jak dla zakresu bez punktów.
+        """
+        out = super().window(begin_time, end_time)
+        if out is None or len(out) < 2:
+            return None
+        return out
+
+    def sliding_windows(self, begin_times, size):
+        """Nadpisuje Wave.sliding_windows. Okna o stałej liczbie 
+        punktów obejmowałyby przy przerwach w próbkowaniu inne zakresy
+        czasu niż size sekund, więc nie są obsługiwane; należy najpierw
+        przepróbkować przebieg (patrz resampled) lub użyć window.
+        """
+        raise ValueError('Okna przesuwne wymagają przebiegów '
+                         'o regularnym próbkowaniu')
+
+    def _window(self, begin_i, end_i):
+        """Nadpisuje Wave._window. Czasy punktów okna liczone są od
+        jego pierwszego punktu, a sample_length pochodzi z self, więc
+        okno obejmujące przerwę dzieli się na te same odcinki co self
+        i nie wychodzi poza jego koniec.
+        """
+        timestamps = self.timestamps[begin_i:end_i]
+        return IrregularWave(self.data[begin_i:end_i], 
+                             timestamps - timestamps[0], self.type,
+                             offset=self.offset + timestamps[0],
+                             value_scale=self.value_scale,
+                             value_offset=self.value_offset,
+                             tolerance=self.tolerance,
+                             sample_length=self.sample_length)
+
+    def _approx_indices(self, times):
+        """Zwraca ułamkowe indeksy punktów przebiegu odpowiadające
+        danym czasom.
+
+        Nadpisuje Wave._approx_indices.
+        """
+        scalar = np.ndim(times) == 0
+        times = np.atleast_1d(np.asarray(times, dtype=float)) - self.offset
+        segments = np.searchsorted(self._segment_times, times, 'right') - 1
+        segments = np.clip(segments, 0, len(self._segment_times)-1)
+        approx_indices = (self._segment_begins[segments]
+                          + (times-self._segment_times[segments])
+                          / self._segment_steps[segments])
+        # Czasy w przerwach między odcinkami, na nieregularnych
+        # odcinkach oraz przed początkiem danych wymagają wyszukania
+        # sąsiednich punktów w tablicy czasów
+        exact = (~self._segment_regular[segments]
+                 | (approx_indices > self._segment_ends[segments])
+                 | (approx_indices < 0))
+        if np.any(exact) and len(self.timestamps) > 1:
+            exact_times = times[exact]
+            previous = np.searchsorted(self.timestamps, exact_times,
+                                       'right') - 1
+            previous = np.clip(previous, 0, len(self.timestamps)-2)
+            approx_indices[exact] = previous + (
+                (exact_times-self.timestamps[previous])
+                / (self.timestamps[previous+1]-self.timestamps[previous]))
+        if scalar:
+            return approx_indices[0]
+        return approx_indices
+
+    def generate_coordinate_tables(self, begin_time=0, end_time=None,
+                                   begin_x=0):
+        """Zwraca wszystkie punkty przebiegu w formie dwóch tablic -
+        wartości x oraz wartości y, przy czym wartości x odpowiadają
+        rzeczywistym czasom punktów.
+
+        Nadpisuje Wave.generate_coordinate_tables.
+        """
+        if end_time is None:
+            end_time = self.offset + self.complete_length
+        output_y = self.data_slice(begin_time, end_time)
+        begin_i = self.sample_at(begin_time)
+        timestamps = self.timestamps[begin_i:begin_i+output_y.shape[-1]]
+        output_x = begin_x + timestamps - self.timestamps[begin_i]
         return output_x, output_y
 
+class _LazyArray():
+    """Podstawa tablic, których wartości nie leżą w jednej tablicy 
+    numpy. Udostępnia indeksowanie wzdłuż ostatniej osi jak tablica
+    numpy, odczytując za każdym razem tylko kawałki po chunk_size
+    punktów, w które trafiają żądane indeksy. Podklasy określają
+    shape, ndim, dtype i chunk_size oraz implementują 
+    _evaluate_range.
+    """
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self._evaluate_range(0, self.shape[-1])
+        if dtype is not None:
+            values = values.astype(dtype, copy=False)
+        return values
+
+    def __getitem__(self, key):
+        """Obsługuje indeksowanie postaci [..., indeksy] (jak w Wave),
+        gdzie indeksy to wycinek, liczba lub tablica liczb, a także
+        indeksowanie pierwszych osi (kanałów) przy pozostawieniu całej 
+        ostatniej osi.
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) == 2 and key[0] is Ellipsis:
+            leading, last = (), key[1]
+        elif len(key) == self.ndim and Ellipsis not in key:
+            leading, last = key[:-1], key[-1]
+        else:
+            leading, last = key, slice(None)
+        length = self.shape[-1]
+        if isinstance(last, slice):
+            begin_i, end_i, step = last.indices(length)
+            if step > 0:
+                values = self._evaluate_range(begin_i, max(end_i, begin_i))
+                values = values[..., ::step]
+            else:
+                values = self[..., np.arange(begin_i, end_i, step)]
+        elif np.ndim(last) == 0:
+            index = int(last)
+            if index < 0:
+                index += length
+            if not 0 <= index < length:
+                raise IndexError('Indeks %s poza zakresem danych' % last)
+            values = self._evaluate_range(index, index+1)[..., 0]
+        else:
+            values = self._take(np.asarray(last))
+        if len(leading) > 0:
+            values = values[leading + (Ellipsis,)]
+        return values
+
+    def _take(self, indices):
+        """Zwraca wartości w punktach o danych indeksach, obliczając
+        tylko kawałki, w które one trafiają.
+        """
+        length = self.shape[-1]
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        flat = np.where(indices < 0, indices+length, indices).ravel()
+        if np.any((flat < 0) | (flat >= length)):
+            raise IndexError('Indeks poza zakresem danych')
+        out = np.empty(self.shape[:-1] + (len(flat),), dtype=self.dtype)
+        order = np.argsort(flat, kind='stable')
+        sorted_indices = flat[order]
+        chunk_ids = sorted_indices // self.chunk_size
+        bounds = np.flatnonzero(np.diff(chunk_ids)) + 1
+        for group in np.split(np.arange(len(flat)), bounds):
+            if len(group) == 0:
+                continue
+            group_indices = sorted_indices[group]
+            begin_i = group_indices[0]
+            values = self._evaluate_range(begin_i, group_indices[-1]+1)
+            out[..., order[group]] = values[..., group_indices-begin_i]
+        return out.reshape(self.shape[:-1] + indices.shape)
+
+    def _evaluate_range(self, begin_i, end_i):
+        """Zwraca tablicę wartości w punktach <begin_i; end_i)."""
+        raise NotImplementedError
+
+class _ChunkedData(_LazyArray):
+    """Dane AppendableWave przechowywane w osobnych tablicach po
+    chunk_size punktów (kawałkach). Wycinek mieszczący się w jednym
+    kawałku jest jego widokiem tylko do odczytu, a dłuższe wycinki są
+    z kawałków sklejane. Zapis (tylko do wycinków ostatniej osi) 
+    trafia bezpośrednio do kawałków.
+    """
+
+    ndim = 1
+
+    def __init__(self, chunks, length, chunk_size, dtype, writeable=True):
+        self.chunks = chunks
+        self.shape = (length,)
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)
+        self.writeable = writeable
+
+    def read_only(self):
+        """Zwraca dane tylko do odczytu współdzielące kawałki z self."""
+        return _ChunkedData(list(self.chunks), self.shape[0],
+                            self.chunk_size, self.dtype, writeable=False)
+
+    def copy(self):
+        """Zwraca kopię danych, kopiując kolejno każdy z kawałków."""
+        chunks = [chunk.copy() for chunk in self.chunks]
+        return _ChunkedData(chunks, self.shape[0], self.chunk_size,
+                            self.dtype)
+
+    def _pieces(self, begin_i, end_i):
+        """Zwraca kolejne trójki (kawałek, indeks jego pierwszego 
+        punktu, wycinek kawałka) pokrywające punkty <begin_i; end_i).
+        """
+        for chunk_i in range(begin_i // self.chunk_size,
+                             -(-end_i // self.chunk_size)):
+            chunk_begin = chunk_i * self.chunk_size
+            yield (self.chunks[chunk_i], chunk_begin,
+                   slice(max(begin_i-chunk_begin, 0),
+                         min(end_i-chunk_begin, self.chunk_size)))
+
+    def _evaluate_range(self, begin_i, end_i):
+        pieces = [chunk[part] for chunk, _, part 
+                  in self._pieces(begin_i, end_i)]
+        if len(pieces) == 1:
+            return _read_only(pieces[0])
+        if len(pieces) == 0:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(pieces)
+
+    def __setitem__(self, key, values):
+        """Obsługuje przypisanie postaci [..., wycinek] (jak w Wave)."""
+        if not self.writeable:
+            raise ValueError('Dane są tylko do odczytu')
+        if isinstance(key, tuple) and len(key) == 2 and key[0] is Ellipsis:
+            key = key[1]
+        if not isinstance(key, slice):
+            raise IndexError('Dane można zmieniać tylko wycinkami')
+        begin_i, end_i, step = key.indices(self.shape[0])
+        if step != 1:
+            raise IndexError('Dane można zmieniać tylko wycinkami '
+                             'o kroku 1')
+        end_i = max(end_i, begin_i)
+        values = np.broadcast_to(values, (end_i-begin_i,))
+        for chunk, chunk_begin, part in self._pieces(begin_i, end_i):
+            chunk[part] = values[chunk_begin+part.start-begin_i:
+                                 chunk_begin+part.stop-begin_i]
+
+class AppendableWave(Wave):
+    """Wave, do którego można na bieżąco dopisywać nowe próbki, np.
+    podczas akwizycji danych. Próbki przechowywane są w osobnych
+    tablicach po chunk_size punktów (patrz _ChunkedData); dopisanie
+    wypełnia ostatni z kawałków i w razie potrzeby tworzy kolejne, 
+    nigdy nie kopiując już zapisanych danych, więc nawet przy bardzo
+    długich nagraniach nie wymaga chwilowo podwójnej ilości pamięci.
+
+    Wave.data oraz Wave.complete_length odpowiadają zawsze próbkom
+    dopisanym do tej pory. Pojedynczy spójny stan przebiegu, który nie
+    zmieni się przy kolejnych dopisaniach, zwraca snapshot; 
+    współdzieli on z przebiegiem kawałki danych.
+    """
+
+    def __init__(self, sample_rate, wave_type, data=None, offset=0,
+                 dtype=float, value_scale=1, value_offset=0,
+                 chunk_size=65536):
+        """Inicjalizuje AppendableWave. Przyjmuje częstotliwość
+        samplowania oraz typ przebiegu (np. 'bp'), a także opcjonalnie
+        początkowe dane. Próbki zapisywane są w typie dtype z
+        przeliczeniem określonym przez value_scale i value_offset.
+        """
+        self.sample_rate = sample_rate
+        self.sample_length = 1/sample_rate
+        self.type = wave_type
+        self.offset = offset
+        self.value_scale = value_scale
+        self.value_offset = value_offset
+        self.chunk_size = chunk_size
+        # Kawałki oraz liczba zapisanych w nich próbek przechowywane są
+        # razem, by czytający zawsze widzieli spójną ich parę.
+        self._dtype = np.dtype(dtype)
+        self._state = ([], 0)
+        if data is not None:
+            self.append(data)
+
+    @property
+    def data(self):
+        chunks, length = self._state
+        return _ChunkedData(chunks, length, self.chunk_size, self._dtype)
+
+    @data.setter
+    def data(self, data):
+        if not isinstance(data, _ChunkedData):
+            data = np.asarray(data)
+            chunks = []
+            for begin_i in range(0, len(data), self.chunk_size):
+                chunk = np.empty(self.chunk_size, dtype=data.dtype)
+                part = data[begin_i:begin_i+self.chunk_size]
+                chunk[:len(part)] = part
+                chunks.append(chunk)
+            data = _ChunkedData(chunks, len(data), self.chunk_size, 
+                                data.dtype)
+        self._dtype = data.dtype
+        self._state = (data.chunks, data.shape[0])
+
+    @property
+    def complete_length(self):
+        return self._state[1] * self.sample_length
+
+    def append(self, samples):
+        """Dopisuje próbki (w jednostkach fizycznych) na koniec
+        przebiegu.
+        """
+        self._check_writable()
+        chunks, length = self._state
+        samples = np.atleast_1d(self._encode(samples))
+        new_length = length + len(samples)
+        while len(chunks) * self.chunk_size < new_length:
+            chunks.append(np.empty(self.chunk_size, dtype=self._dtype))
+        # Nowe próbki trafiają za dotychczasowy koniec danych, więc
+        # wcześniej pobrane Wave.data pozostają niezmienione
+        data = _ChunkedData(chunks, new_length, self.chunk_size, 
+                            self._dtype)
+        data[length:new_length] = samples
+        self._state = (chunks, new_length)
+        self._invalidate_statistics(length, new_length)
+        self._changed()
+
+    def _snapshot(self):
+        """Nadpisuje _VersionedData._snapshot. Migawką jest zwykły Wave
+        z próbkami dopisanymi do tej pory. Dane nie są kopiowane, 
+        a kolejne dopisania nie wpływają na zwrócony Wave.
+        """
+        if self._state[1] == 0:
+            raise ValueError('Przebieg nie zawiera jeszcze żadnych danych')
+        data = self.data.read_only()
+        snapshot = Wave(data, len(data)*self.sample_length,
+                        self.type, offset=self.offset,
+                        value_scale=self.value_scale,
+                        value_offset=self.value_offset)
+        snapshot._share_data(self)
+        return snapshot
+
+class _ExpressionData(_LazyArray):
+    """Leniwa tablica wartości WaveExpression. Udostępnia shape, dtype
+    oraz indeksowanie wzdłuż ostatniej osi jak tablica numpy, ale
+    wartości oblicza dopiero przy odczycie i tylko dla żądanych 
+    punktów, kawałkami po chunk_size punktów.
+
+    Graf wyrażenia składa się z krotek:
+        ('wave', wave) - wartości przebiegu (w jednostkach fizycznych)
+        ('const', value) - stała
+        ('ufunc', ufunc, *argumenty) - funkcja numpy na argumentach
+        ('derivative', argument) - pochodna po czasie
+    Jednakowe poddrzewa są równymi krotkami, więc w obrębie kawałka
+    liczone są tylko raz, a wyniki pośrednie używane jednokrotnie są
+    nadpisywane w miejscu zamiast tworzenia nowych tablic.
+    """
+
+    def __init__(self, root, chunk_size):
+        self.root = root
+        self.chunk_size = chunk_size
+        self._uses = {}
+        leaves = []
+        self._count_uses(root, leaves)
+        for leaf in leaves:
+            if isinstance(leaf, IrregularWave):
+                raise ValueError('Wyrażenia wymagają przebiegów '
+                                 'o regularnym próbkowaniu')
+            if not isclose(leaf.sample_length, leaves[0].sample_length,
+                           rel_tol=0.0001):
+                raise ValueError('Przebiegi w wyrażeniu mają różne '
+                                 'częstotliwości danych')
+        self.sample_length = leaves[0].sample_length
+        # Wspólny zakres czasu wszystkich przebiegów; każdy z nich
+        # jest odczytywany z przesunięciem o całkowitą liczbę punktów
+        self.offset = max(leaf.offset for leaf in leaves)
+        self._shifts = {
+            leaf: int(round((self.offset-leaf.offset) / self.sample_length))
+            for leaf in leaves}
+        length = min(len(leaf)-self._shifts[leaf] for leaf in leaves)
+        if length <= 0:
+            raise ValueError('Przebiegi w wyrażeniu nie mają wspólnego '
+                             'zakresu czasu')
+        self.shape = np.broadcast_shapes(
+            *(leaf.data.shape[:-1] for leaf in leaves)) + (length,)
+        self.ndim = len(self.shape)
+        self.leaves = leaves
+
+    def _count_uses(self, node, leaves):
+        """Zlicza, w ilu miejscach grafu używane jest każde poddrzewo
+        i zbiera przebiegi (bez powtórzeń).
+        """
+        self._uses[node] = self._uses.get(node, 0) + 1
+        if self._uses[node] > 1:
+            return
+        if node[0] == 'wave':
+            if not any(leaf is node[1] for leaf in leaves):
+                leaves.append(node[1])
+        elif node[0] == 'ufunc':
+            for argument in node[2:]:
+                self._count_uses(argument, leaves)
+        elif node[0] == 'derivative':
+            self._count_uses(node[1], leaves)
+
+    @property
+    def dtype(self):
+        dtype = self.__dict__.get('_dtype')
+        if dtype is None:
+            dtype = self._evaluate_range(0, 1, dtype=None).dtype
+            self._dtype = dtype
+        return dtype
+
+    def _evaluate_range(self, begin_i, end_i, dtype=0):
+        """Oblicza wartości wyrażenia w punktach <begin_i; end_i)
+        kolejnymi kawałkami, zapisując wynik każdego z nich od razu do
+        tablicy wynikowej.
+        """
+        if dtype == 0:
+            dtype = self.dtype
+        if dtype is None:
+            values, _ = self._evaluate(self.root, begin_i, end_i, {})
+            return np.array(np.broadcast_to(
+                values, self.shape[:-1] + (end_i-begin_i,)))
+        out = np.empty(self.shape[:-1] + (end_i-begin_i,), dtype=dtype)
+        for chunk_begin in range(begin_i, end_i, self.chunk_size):
+            chunk_end = min(chunk_begin+self.chunk_size, end_i)
+            self._evaluate(self.root, chunk_begin, chunk_end, {},
+                           out[..., chunk_begin-begin_i:chunk_end-begin_i])
+        return out
+
+    def _evaluate(self, node, begin_i, end_i, memo, out=None):
+        """Oblicza wartości poddrzewa w punktach <begin_i; end_i).
+        Zwraca krotkę: wartości oraz czy są one tymczasową tablicą,
+        którą można nadpisać. Jeśli podano out, wynik jest do niej 
+        zapisywany.
+        """
+        key = (node, begin_i, end_i)
+        if key in memo:
+            values, temporary = memo[key], False
+        else:
+            values, temporary = self._compute(node, begin_i, end_i, memo,
+                                              out)
+            if self._uses[node] > 1:
+                # Wynik używany jest jeszcze gdzieś w grafie
+                memo[key] = values
+                temporary = False
+        if out is not None and values is not out:
+            out[...] = values
+            return out, False
+        return values, temporary
+
+    def _compute(self, node, begin_i, end_i, memo, out):
+        kind = node[0]
+        if kind == 'const':
+            return node[1], False
+        if kind == 'wave':
+            wave = node[1]
+            shift = self._shifts[wave]
+            return (wave._decode(wave.data[..., begin_i+shift:end_i+shift]),
+                    False)
+        if kind == 'derivative':
+            # Różnica centralna; na krańcach wyrażenia jednostronna
+            length = self.shape[-1]
+            first_i = max(begin_i-1, 0)
+            values, _ = self._evaluate(node[1], first_i, 
+                                       min(end_i+1, length), memo)
+            indices = np.arange(begin_i, end_i)
+            previous = np.maximum(indices-1, 0)
+            following = np.minimum(indices+1, length-1)
+            distances = np.maximum(following-previous, 1) * self.sample_length
+            return ((values[..., following-first_i]
+                     - values[..., previous-first_i]) / distances, True)
+        ufunc = node[1]
+        arguments = []
+        temporaries = []
+        for argument in node[2:]:
+            values, temporary = self._evaluate(argument, begin_i, end_i, 
+                                               memo)
+            arguments.append(values)
+            temporaries.append(temporary)
+        if out is None:
+            # Nadpisujemy tymczasowy wynik argumentu, jeśli ma on
+            # kształt i typ wyniku
+            result_dtype = np.result_type(*arguments)
+            result_shape = np.broadcast_shapes(*(np.shape(argument) 
+                                                 for argument in arguments))
+            for values, temporary in zip(arguments, temporaries):
+                if (temporary and values.dtype == result_dtype
+                        and values.dtype.kind in 'fc'
+                        and values.shape == result_shape):
+                    out = values
+                    break
+        return ufunc(*arguments, out=out), True
+
+class WaveExpression(Wave):
+    """Przebieg, którego wartości wyliczane są leniwie z innych
+    przebiegów (np. różnica BP i linii bazowej) i nie są nigdzie 
+    przechowywane. Zapamiętywany jest jedynie graf działań, a wartości
+    obliczane są przy każdym odczycie tylko dla żądanego zakresu, 
+    kawałkami po chunk_size punktów (patrz _ExpressionData).
+
+    WaveExpression może być używany wszędzie tam, gdzie Wave (np. w 
+    procedurach czy na wykresach). Tworzy się go funkcją expr lub
+    działaniami arytmetycznymi na Wave, np.:
+        sm.expr(waves['bp'] - waves['baseline'])
+        (waves['ecg_1'] - waves['ecg_2']).derivative() ** 2
+
+    Przebiegi w wyrażeniu muszą mieć tę samą, regularną częstotliwość
+    danych. Wyrażenie obejmuje ich wspólny zakres czasu; zmiany 
+    przebiegów (wartości, przesunięcia w czasie) są w nim od razu 
+    widoczne, a on sam otrzymuje wtedy nową wersję. Wyrażenia nie 
+    można modyfikować; należy najpierw utworzyć z niego zwykły Wave 
+    (patrz materialize).
+    """
+
+    # Liczba punktów obliczanych naraz
+    chunk_size = 65536
+
+    def __init__(self, root, wave_type=None):
+        """Inicjalizuje WaveExpression z grafu wyrażenia (patrz
+        _ExpressionData). Zwykle należy korzystać z funkcji expr.
+        """
+        self._root = root
+        self._build()
+        if wave_type is None:
+            wave_type = self.data.leaves[0].type
+        self.type = wave_type
+        for leaf in self.data.leaves:
+            leaf._add_listener(self)
+
+    def _build(self):
+        """Oblicza wspólny zakres czasu przebiegów wyrażenia."""
+        self.data = _ExpressionData(self._root, self.chunk_size)
+        self.sample_length = self.data.sample_length
+        self.sample_rate = 1/self.sample_length
+        self.complete_length = self.data.shape[-1] * self.sample_length
+        self._offset = self.data.offset
+
+    @property
+    def offset(self):
+        return self._offset
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # Wartości są obliczane na nowo po wczytaniu
+        state.pop('data')
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._build()
+        for leaf in self.data.leaves:
+            leaf._add_listener(self)
+
+    def _member_changed(self, leaf):
+        try:
+            self._build()
+        except ValueError:
+            # Przebiegi przestały mieć wspólny zakres czasu; zmiana
+            # przebiegu nie może się przez to nie udać, więc wyrażenie
+            # zachowuje dotychczasowy zakres
+            pass
+        self.__dict__.pop('_range_statistics', None)
+        self._changed()
+
+    def copy(self):
+        out = WaveExpression(self._root, self.type)
+        out.version = self.version
+        return out
+
+    def _snapshot(self):
+        """Nadpisuje _VersionedData._snapshot. Migawka wyrażenia jest
+        wyrażeniem na migawkach jego przebiegów, więc nadal nie 
+        przechowuje wartości.
+        """
+        return WaveExpression(_replace_leaves(
+            self._root, {leaf: leaf.snapshot() 
+                         for leaf in self.data.leaves}), self.type)
+
+    def apply(self, function, *operands):
+        """Zwraca wyrażenie będące wynikiem funkcji numpy (ufunc, 
+        np. np.sqrt lub np.maximum) na wartościach self i danych 
+        argumentach (Wave, WaveExpression lub liczbach).
+        """
+        if not isinstance(function, np.ufunc):
+            raise TypeError('Wyrażenia obsługują tylko funkcje np.ufunc')
+        out = _combine(function, self, *operands)
+        if out is NotImplemented:
+            raise TypeError('Argumentami wyrażenia mogą być tylko Wave '
+                            'i liczby')
+        return out
+
+    def derivative(self):
+        """Zwraca wyrażenie będące pochodną self po czasie (różnica
+        centralna sąsiednich punktów).
+        """
+        return WaveExpression(('derivative', self._root), self.type)
+
+    def materialize(self):
+        """Zwraca zwykły Wave z obliczonymi wartościami wyrażenia."""
+        return Wave(np.array(self.data), self.complete_length, self.type,
+                    offset=self.offset)
+
+    def replace_slice(self, begin_time, end_time, wave):
+        raise TypeError('Wyrażenie nie może być modyfikowane; należy '
+                        'najpierw użyć materialize')
+
+def _replace_leaves(node, leaves):
+    """Zwraca graf wyrażenia z przebiegami zamienionymi według dict
+    leaves.
+    """
+    if node[0] == 'wave':
+        return ('wave', leaves[node[1]])
+    if node[0] == 'ufunc':
+        return node[:2] + tuple(_replace_leaves(argument, leaves)
+                                for argument in node[2:])
+    if node[0] == 'derivative':
+        return ('derivative', _replace_leaves(node[1], leaves))
+    return node
+
+def _combine(function, *operands):
+    """Tworzy wyrażenie z funkcji numpy na danych argumentach (Wave,
+    WaveExpression lub liczbach), z których co najmniej jeden jest
+    Wave. Typ wyrażenia pochodzi od pierwszego z nich.
+    """
+    nodes = []
+    wave_type = None
+    for operand in operands:
+        if isinstance(operand, Wave):
+            operand = expr(operand)
+            nodes.append(operand._root)
+            if wave_type is None:
+                wave_type = operand.type
+        elif np.ndim(operand) == 0 and np.isscalar(operand):
+            nodes.append(('const', operand))
+        else:
+            return NotImplemented
+    return WaveExpression(('ufunc', function) + tuple(nodes), wave_type)
+
+def expr(wave, wave_type=None):
+    """Zwraca leniwe wyrażenie (WaveExpression) z danego Wave, 
+    WaveExpression lub liczby. Działania na wyrażeniach (oraz na Wave)
+    tworzą kolejne wyrażenia, obliczane dopiero przy odczycie wartości.
+    """
+    if isinstance(wave, WaveExpression):
+        if wave_type is None or wave_type == wave.type:
+            return wave
+        return WaveExpression(wave._root, wave_type)
+    if isinstance(wave, Wave):
+        return WaveExpression(('wave', wave), wave_type)
+    raise TypeError('Wyrażenie musi zawierać co najmniej jeden Wave')
+
 class EmptyPointsError(Exception):
     pass
 
-class Points():
+class Points(_VersionedData):
     """Klasa symbolizująca zestaw punktów jednego typu (np. R).
     Przechowuje je w dwóch tablicach - wartości x i y wszystkich
     punktów, posortowanych według x.
 
+    Oprócz x i y każdy punkt może mieć wartości w nazwanych kolumnach
+    atrybutów (np. pewność detekcji czy klasa uderzenia serca). Kolumny
+    są tablicami NumPy sortowanymi, wycinanymi, scalanymi i usuwanymi
+    razem z x i y.
+
+    Wewnętrznie punkty trzymane są w posortowanych blokach o długości
+    rzędu block_size, dzięki czemu dodanie, usunięcie lub przesunięcie
+    pojedynczego punktu kosztuje O(log n + block_size) zamiast
+    przepisywania całych tablic. Ciągłe tablice data_x i data_y są
+    składane z bloków przy pierwszym odczycie po zmianie i są tylko do
+    odczytu.
+
     Atrybuty:
         Points.data_x - tablica wartości x punktów
         Points.data_y - tablica wartości y punktów
         Points.point_type - typ punktów, np. 'r' czy 'sbp' 
+        Points.column_names - krotka nazw kolumn atrybutów
+        Points.version - numer wersji danych, rośnie przy każdej zmianie
     """
 
-    def __init__(self, data_x, data_y, point_type):
+    # Docelowa długość bloku; blok dwa razy dłuższy jest dzielony
+    block_size = 1024
+
+    def __init__(self, data_x, data_y, point_type, assume_sorted=False,
+                 columns=None):
         """Inicjalizuje Points. Przyjmuje dwie tablice x i y
         punktów, a także typ punktów (np. 'r').
+
+        Jeśli assume_sorted jest True, to punkty muszą już być
+        posortowane według x i nie jest to sprawdzane. Tablice tylko do
+        odczytu (np. data_x innego Points) są wtedy używane bez
+        kopiowania.
+
+        columns - opcjonalny dict nazwa kolumny -> tablica wartości
+                  atrybutu dla kolejnych punktów z data_x
         """
+        if columns is None:
+            columns = {}
         if len(data_x) > 0:
-            # sortowanie by punkty były po kolei
-            temp_data_x, temp_data_y = zip(*sorted(zip(data_x,data_y)))
-            self.data_x = np.array(temp_data_x) 
-            self.data_y = np.array(temp_data_y) 
+            self.column_names = tuple(columns)
+            data = [np.asarray(data_x), np.asarray(data_y)]
+            data += [np.asarray(column) for column in columns.values()]
+            for column in data[1:]:
+                if len(column) != len(data[0]):
+                    raise ValueError('Tablice x i y punktów oraz kolumny '
+                                     'atrybutów mają różne długości')
+            if not assume_sorted and np.any(data[0][1:] < data[0][:-1]):
+                # sortowanie by punkty były po kolei; punkty o równym
+                # x porządkowane są według y
+                order = np.lexsort((data[1], data[0]))
+                data = [column[order] for column in data]
+            # Tablice stają się tylko do odczytu, więc nie przejmujemy
+            # zapisywalnych tablic podanych z zewnątrz
+            data = [column.copy() if column.flags.writeable else column
+                    for column in data]
+            self._set_data(tuple(data))
             self.type = point_type 
         else:
             raise EmptyPointsError
     
     @classmethod
     def fromPoints(cls, points):
-        return cls(points.data_x, points.data_y,
-                   point_type = points.type)
+        """Zwraca kopię danego Points. Bloki punktów nigdy nie są
+        modyfikowane w miejscu (każda zmiana tworzy nowy blok), więc
+        kopia kopiuje jedynie listy bloków, a same tablice współdzieli
+        z oryginałem (copy-on-write).
+        """
+        out = cls.__new__(cls)
+        out.column_names = points.column_names
+        out._dtypes = points._dtypes
+        out._blocks = list(points._blocks)
+        out._block_ends = list(points._block_ends)
+        out._block_starts = points._block_starts
+        out._joined = points._joined
+        out.type = points.type
+        out.version = points.version
+        return out
 
     def copy(self):
         return Points.fromPoints(self)
 
     def __len__(self):
-        return len(self.data_x)
+        return int(self._starts()[-1])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Tablice pomocnicze są odtwarzane z bloków przy potrzebie
+        state['_joined'] = None
+        state['_block_starts'] = None
+        state.pop('_listeners', None)
+        state.pop('_last_snapshot', None)
+        return state
+
+    def __setstate__(self, state):
+        # Obsługa Points zapisanych zanim dane trzymane były w blokach
+        if 'data_x' in state:
+            data_x = np.array(state.pop('data_x'))
+            data_y = np.array(state.pop('data_y'))
+            self.__dict__.update(state)
+            self.column_names = ()
+            self._set_data((data_x, data_y))
+        else:
+            self.__dict__.update(state)
+
+    @property
+    def data_x(self):
+        return self._joined_data()[0]
+
+    @property
+    def data_y(self):
+        return self._joined_data()[1]
+
+    def column(self, name):
+        """Zwraca tablicę (tylko do odczytu) wartości atrybutu o danej
+        nazwie dla wszystkich punktów.
+        """
+        return self._joined_data()[self._column_index(name)]
+
+    def add_column(self, name, values):
+        """Dodaje kolumnę atrybutu. values muszą odpowiadać kolejnym
+        punktom z data_x.
+        """
+        self._check_writable()
+        if name in self.column_names:
+            raise ValueError('Kolumna %s już istnieje' % name)
+        values = np.array(values)
+        if len(values) != len(self):
+            raise ValueError('Kolumna musi mieć tyle wartości ile jest '
+                             'punktów')
+        self.column_names += (name,)
+        self._set_data(self._joined_data() + (values,))
+
+    def delete_column(self, name):
+        """Usuwa kolumnę atrybutu."""
+        self._check_writable()
+        index = self._column_index(name)
+        data = self._joined_data()
+        self.column_names = tuple(column_name 
+                                  for column_name in self.column_names
+                                  if column_name != name)
+        self._set_data(data[:index] + data[index+1:])
+
+    def _column_index(self, name):
+        """Zwraca indeks kolumny atrybutu w krotce bloku."""
+        if name not in self.column_names:
+            raise KeyError('Nie ma kolumny %s' % name)
+        return 2 + self.column_names.index(name)
+
+    def _missing_values(self, count):
+        """Zwraca wartości kolumn atrybutów dla punktów, dla których ich
+        nie podano - NaN w kolumnach zmiennoprzecinkowych, a 0 w 
+        pozostałych.
+        """
+        missing = []
+        for dtype in self._dtypes[2:]:
+            if np.issubdtype(dtype, np.inexact):
+                missing.append(np.full(count, np.nan, dtype=dtype))
+            else:
+                missing.append(np.zeros(count, dtype=dtype))
+        return missing
+
+    def _columns_of(self, points, selection=slice(None)):
+        """Zwraca wartości własnych kolumn atrybutów dla (wybranych)
+        punktów innego Points. Brakujące kolumny wypełniane są jak w
+        _missing_values.
+        """
+        count = len(points.data_x[selection])
+        missing = self._missing_values(count)
+        return [points.column(name)[selection]
+                if name in points.column_names else missing[i]
+                for i, name in enumerate(self.column_names)]
+
+    def _set_data(self, data):
+        """Zastępuje wszystkie punkty danymi, posortowanymi według x,
+        tablicami (x, y, kolejne kolumny atrybutów). Tablice przechodzą
+        na własność Points.
+        """
+        self._check_writable()
+        for column in data:
+            column.flags.writeable = False
+        self._dtypes = tuple(column.dtype for column in data)
+        self._blocks = [
+            tuple(column[i:i+self.block_size] for column in data)
+            for i in range(0, len(data[0]), self.block_size)]
+        self._block_ends = [block[0][-1] for block in self._blocks]
+        self._block_starts = None
+        self._joined = data
+        self._changed()
+
+    def _merge(self, data):
+        """Zastępuje wszystkie punkty danymi tablicami, sortując je
+        stabilnie według x.
+        """
+        order = np.argsort(data[0], kind='stable')
+        self._set_data(tuple(column[order] for column in data))
+
+    def _joined_data(self):
+        """Zwraca ciągłe tablice x, y i kolumn atrybutów, składając je
+        z bloków jeśli zmieniły się od ostatniego odczytu.
+        """
+        if self._joined is None:
+            if len(self._blocks) == 0:
+                joined = tuple(np.array([], dtype=dtype) 
+                               for dtype in self._dtypes)
+            else:
+                joined = tuple(np.concatenate(column)
+                               for column in zip(*self._blocks))
+            for column in joined:
+                column.flags.writeable = False
+            self._joined = joined
+        return self._joined
+
+    def _starts(self):
+        """Zwraca tablicę indeksów pierwszych punktów kolejnych bloków,
+        zakończoną liczbą wszystkich punktów.
+        """
+        if self._block_starts is None:
+            lengths = [len(block[0]) for block in self._blocks]
+            self._block_starts = np.concatenate(([0], np.cumsum(lengths)))
+        return self._block_starts
+
+    def _blocks_changed(self):
+        self._block_starts = None
+        self._joined = None
+        self._changed()
+
+    def time_span(self):
+        """Zwraca czas pierwszego i ostatniego punktu lub None, jeśli
+        nie ma żadnych punktów.
+        """
+        if len(self._blocks) == 0:
+            return None
+        return self._blocks[0][0][0], self._block_ends[-1]
+
+    def window(self, begin_time, end_time):
+        """Zwraca Points z punktami (wraz z kolumnami atrybutów) 
+        z zakresu czasu <begin_time; end_time). Tablice zwróconego
+        Points są widokami tablic self, bez kopiowania. Jeśli w
+        zakresie nie ma punktów, zwraca None.
+        """
+        temp_range = self.slice_range(begin_time, end_time)
+        if temp_range is None:
+            return None
+        out = Points.__new__(Points)
+        out.type = self.type
+        out.column_names = self.column_names
+        out._set_data(tuple(column[temp_range[0]:temp_range[-1]+1]
+                            for column in self._joined_data()))
+        out.version = self.version
+        return out
+
+    def _locate(self, i):
+        """Zamienia indeks punktu na indeks bloku i indeks w bloku."""
+        starts = self._starts()
+        block_i = int(np.searchsorted(starts, i, side='right')) - 1
+        return block_i, i - starts[block_i]
+
+    def _point_at(self, i):
+        """Zwraca krotkę (x, y, kolejne atrybuty) punktu o danym
+        indeksie.
+        """
+        block_i, j = self._locate(i)
+        return tuple(column[j] for column in self._blocks[block_i])
+
+    def _searchsorted(self, x):
+        """Działa jak np.searchsorted(self.data_x, x), ale bez składania
+        bloków w ciągłe tablice.
+        """
+        block_i = bisect_left(self._block_ends, x)
+        if block_i == len(self._blocks):
+            return len(self)
+        return int(self._starts()[block_i]
+                   + np.searchsorted(self._blocks[block_i][0], x))
+
+    def _insert(self, values):
+        """Wstawia jeden punkt (krotkę x, y i kolejnych atrybutów) do
+        odpowiedniego bloku.
+        """
+        self._check_writable()
+        x = values[0]
+        if len(self._blocks) == 0:
+            self._set_data(tuple(np.array([value], dtype=dtype)
+                                 for value, dtype 
+                                 in zip(values, self._dtypes)))
+            return
+        block_i = min(bisect_left(self._block_ends, x), 
+                      len(self._blocks)-1)
+        block = self._blocks[block_i]
+        j = np.searchsorted(block[0], x)
+        block = tuple(np.insert(column, j, value)
+                      for column, value in zip(block, values))
+        if len(block[0]) > 2*self.block_size:
+            half = len(block[0]) // 2
+            self._blocks[block_i:block_i+1] = [
+                tuple(column[:half] for column in block), 
+                tuple(column[half:] for column in block)]
+            self._block_ends[block_i:block_i+1] = [block[0][half-1], 
+                                                   block[0][-1]]
+        else:
+            self._blocks[block_i] = block
+            self._block_ends[block_i] = block[0][-1]
+        self._blocks_changed()
+
+    def _delete(self, i):
+        """Usuwa punkt o danym indeksie z jego bloku. Zwraca krotkę
+        x, y i atrybutów usuniętego punktu.
+        """
+        self._check_writable()
+        block_i, j = self._locate(i)
+        block = self._blocks[block_i]
+        values = tuple(column[j] for column in block)
+        if len(block[0]) == 1:
+            del self._blocks[block_i]
+            del self._block_ends[block_i]
+        else:
+            block = tuple(np.delete(column, j) for column in block)
+            self._blocks[block_i] = block
+            self._block_ends[block_i] = block[0][-1]
+        self._blocks_changed()
+        return values
 
 #   def __getitem__(self, key):
 #       x = self.data_x[key]
@@ -219,21 +2149,24 @@ class Points():
         """Zwraca range indeksów punktów, które znajdują się w danym
         zakresie czasowym. 
         """
-        begin_i = np.searchsorted(self.data_x, begin_time)
-        end_i = np.searchsorted(self.data_x, end_time)
+        begin_i = self._searchsorted(begin_time)
+        end_i = self._searchsorted(end_time)
         # Sprawdzamy czy jest choć jeden punkt
         if begin_i != end_i:
             return range(begin_i, end_i)
         else:
             return None
 
-    def data_slice(self, begin_time, end_time, left_offset=0):
+    def data_slice(self, begin_time, end_time, left_offset=0, 
+                   columns=()):
         """Zwraca tablice współrzędnych x oraz y punktów w danym 
-        zakresie czasu.
+        zakresie czasu, a za nimi tablice wybranych kolumn atrybutów.
 
         Argumenty:
         left_offset - ile punków dodatkowych w lewo, przed zakresem,
                       podać.
+        columns - nazwy kolumn atrybutów do zwrócenia; pozostałe
+                  kolumny nie są wycinane ani kopiowane
         """
         temp_range = self.slice_range(begin_time, end_time)
         if temp_range is None:
@@ -242,40 +2175,67 @@ class Points():
         if begin_i < 0:
             begin_i = 0
         end_i = temp_range[-1]+1
-        return self.data_x[begin_i:end_i], self.data_y[begin_i:end_i]
-
+        indices = [0, 1] + [self._column_index(name) for name in columns]
+        if self._joined is not None:
+            return tuple(self._joined[index][begin_i:end_i]
+                         for index in indices)
+        # Składamy tylko bloki obejmujące żądany zakres
+        first_block, first_j = self._locate(begin_i)
+        last_block, last_j = self._locate(end_i-1)
+        blocks = self._blocks[first_block:last_block+1]
+        output = []
+        for index in indices:
+            column = [block[index] for block in blocks]
+            column[-1] = column[-1][:last_j+1]
+            column[0] = column[0][first_j:]
+            output.append(np.concatenate(column))
+        return tuple(output)
     
     def delete_slice(self, begin_time, end_time):
         """Usuwa punkty w danym zakresie czasu. Zwraca index miejsca
         współrzędnych tablic gdzie były usunięte punkty.
         """
         temp_range = self.slice_range(begin_time, end_time)
-        self.data_x = np.delete(self.data_x, temp_range)
-        self.data_y = np.delete(self.data_y, temp_range)
+        self._set_data(tuple(np.delete(column, temp_range)
+                             for column in self._joined_data()))
         return temp_range[0]
 
     def replace_slice(self, begin_time, end_time, points):
-        begin_i = self.delete_slice(begin_time, end_time)
         """Zastępuje punkty na danym zakresie czasu innym Points.
+        Punkty points liczone są od początku zakresu.
         """
+        self.delete_slice(begin_time, end_time)
         # Teraz wszystkie punkty z points które nie wychodzą poza 
         # ramy czasowe podane w argumentach funkcji wkładamy do wlasnych
         # tablic współrzędnych
-        j = 0
-        while (j < len(points) and 
-                points.data_x[j] < end_time-begin_time):
-            np.insert(self.data_x, begin_i+j, points.data_x[j]+begin_time)
-            np.insert(self.data_y, begin_i+j, points.data_y[j])
+        inside = points.data_x < end_time-begin_time
+        new_data = [points.data_x[inside] + begin_time, 
+                    points.data_y[inside]]
+        new_data += self._columns_of(points, inside)
+        self._merge(tuple(np.concatenate((column, new_column))
+                          for column, new_column 
+                          in zip(self._joined_data(), new_data)))
     
-    def add_point(self, x, y):
-        """Dodaje punkt."""
-        i = np.searchsorted(self.data_x, x)
-        self.data_x=np.insert(self.data_x, i, x)
-        self.data_y=np.insert(self.data_y, i, y)
+    def add_point(self, x, y, **attributes):
+        """Dodaje punkt. Wartości kolumn atrybutów można podać jako
+        argumenty nazwane; pozostałe kolumny otrzymują wartości jak w 
+        _missing_values.
+        """
+        for name in attributes:
+            self._column_index(name)
+        missing = self._missing_values(1)
+        values = (x, y) + tuple(
+            attributes[name] if name in attributes else missing[i][0]
+            for i, name in enumerate(self.column_names))
+        self._insert(values)
         
-    def add_points(self, points, begin_time=0):
+    def add_points(self, points, begin_time=0, tolerance=None):
         """
-        Dodaje wszystkie punkty z danego Points do siebie.
+        Dodaje wszystkie punkty z danego Points do siebie. Punkty są
+        scalane jednorazowo (złączenie tablic i jedno sortowanie), a
+        nie wstawiane po kolei. Kolumny atrybutów, których nie ma w
+        points, wypełniane są jak w _missing_values, a kolumny, których
+        nie ma w self, są pomijane.
         
         Argumenty:
         points - Points do dodania do siebie
@@ -283,52 +2243,124 @@ class Points():
                      np. jeśli dodawany points z własnej perspektywy 
                      zaczyna się na 0 sekundzie gdy naprawdę jest gdzieś 
                      głęboko w wykresie.
+        tolerance - jeśli podana, to pomijane są dodawane punkty, których
+                    x różni się od x któregoś z już posiadanych punktów
+                    o nie więcej niż tolerance, a także duplikaty wśród
+                    samych dodawanych punktów - z każdego ciągu punktów
+                    odległych kolejno o nie więcej niż tolerance 
+                    zostaje tylko pierwszy
         """
-        for x, y in zip(points.data_x, points.data_y):
-            self.add_point(x+begin_time, y)
+        new_x = np.asarray(points.data_x) + begin_time
+        kept = slice(None)
+        if tolerance is not None and len(self) > 0:
+            # Najbliższy posiadany punkt leży tuż przed lub tuż za
+            # miejscem wstawienia
+            i = np.searchsorted(self.data_x, new_x)
+            left_x = self.data_x[np.maximum(i-1, 0)]
+            right_x = self.data_x[np.minimum(i, len(self)-1)]
+            distances = np.minimum(np.abs(new_x-left_x), 
+                                   np.abs(right_x-new_x))
+            kept = distances > tolerance
+        new_data = [new_x[kept], np.asarray(points.data_y)[kept]]
+        new_data += self._columns_of(points, kept)
+        data = tuple(np.concatenate((column, new_column))
+                     for column, new_column 
+                     in zip(self._joined_data(), new_data))
+        if tolerance is None:
+            self._merge(data)
+            return
+        # Po scaleniu dodany punkt leżący nie dalej niż tolerance za 
+        # poprzednim jest duplikatem
+        order = np.argsort(data[0], kind='stable')
+        sorted_x = data[0][order]
+        added = order >= len(self)
+        duplicates = added & np.concatenate(
+            ([False], np.diff(sorted_x) <= tolerance))
+        order = order[~duplicates]
+        self._set_data(tuple(column[order] for column in data))
 
-    def delete_point(self, x, y=None):
+    def delete_point(self, x, y=None, x_scale=1, y_scale=1):
         """Usuwa punkt najbliższy do danych współrzędnych. Argument
         y jest opcjonalny, ponieważ wiekszosść punktów na przebiegach
         symbolizują wydarzenia w czasie i ich y są mniej ważne.
+        x_scale i y_scale działają jak w closest_point_id.
         """
         if y is not None:
-            closest_id = self.closest_point_id(x, y)
+            closest_id = self.closest_point_id(x, y, x_scale=x_scale,
+                                               y_scale=y_scale)
         else:
-            closest_id = np.argmin(np.abs(self.data_x - x))
-        self.data_x = np.delete(self.data_x, closest_id)
-        self.data_y = np.delete(self.data_y, closest_id)
+            # Najbliższy w czasie punkt leży tuż przed lub tuż za
+            # miejscem wstawienia x
+            i = self._searchsorted(x)
+            if i == len(self) or (
+                    i > 0 and x - self._point_at(i-1)[0] 
+                    <= self._point_at(i)[0] - x):
+                i -= 1
+            closest_id = i
+        self._delete(closest_id)
     
     def move_point(self, x1, y1, x2, y2):
+        """Przesuwa punkt z (x1, y1) do (x2, y2), zachowując jego
+        atrybuty.
+        """
         closest_id = self.closest_point_id(x1, y1)
-        if not (isclose(self.data_x[closest_id], x1) and
-                isclose(self.data_y[closest_id], y1)):
+        closest_x, closest_y = self._point_at(closest_id)[:2]
+        x1 = np.asarray(x1, dtype=float).item()
+        y1 = np.asarray(y1, dtype=float).item()
+        if not (isclose(closest_x, x1) and isclose(closest_y, y1)):
             raise ValueError('Nie ma punktu o takich x1 i y1')
         # Powtarzamy się tutaj by nie wywoływać funkcji, które w QtSigman
         # mogą wywołać rysowanie od zera
-        self.data_x = np.delete(self.data_x, closest_id)
-        self.data_y = np.delete(self.data_y, closest_id)
-        i = np.searchsorted(self.data_x, x2)
-        self.data_x=np.insert(self.data_x, i, x2)
-        self.data_y=np.insert(self.data_y, i, y2)
-
-    def closest_point_id(self, x, y):
-        points = np.vstack((self.data_x, self.data_y))
-        point = np.array([[x,y]])
-        comparison_distances = np.sum((points - point)**2, axis=1)
-        return np.argmin(comparison_distances) 
+        attributes = self._delete(closest_id)[2:]
+        self._insert((x2, y2) + attributes)
+
+    def closest_point_id(self, x, y, x_scale=1, y_scale=1):
+        """Zwraca indeks punktu najbliższego do danych współrzędnych.
+        Odległości w osiach x i y dzielone są przez x_scale i y_scale,
+        np. przez wielkość piksela na wykresie, by odległość mierzona
+        była w pikselach.
+
+        Przeszukiwany jest tylko blok zawierający x i bloki sąsiednie,
+        dopóki sama odległość w osi x nie przekracza najlepszej
+        znalezionej odległości.
+        """
+        if len(self) == 0:
+            raise EmptyPointsError
+        # W GUI współrzędne przychodzą jako jednoelementowe tablice
+        x = np.asarray(x, dtype=float).item()
+        y = np.asarray(y, dtype=float).item()
+        first_block = min(bisect_left(self._block_ends, x), 
+                          len(self._blocks)-1)
+        best_distance = np.inf
+        best_id = None
+        for block_ids in (range(first_block, -1, -1),
+                          range(first_block+1, len(self._blocks))):
+            for block_i in block_ids:
+                block_x, block_y = self._blocks[block_i][:2]
+                # Najbliższy punkt bloku w osi x ogranicza od dołu
+                # odległość każdego punktu bloku
+                x_gap = max(block_x[0]-x, x-block_x[-1], 0) / x_scale
+                if x_gap**2 >= best_distance:
+                    break
+                distances = (((block_x-x)/x_scale)**2 
+                             + ((block_y-y)/y_scale)**2)
+                j = np.argmin(distances)
+                if distances[j] < best_distance:
+                    best_distance = distances[j]
+                    best_id = int(self._starts()[block_i] + j)
+        return best_id
 
     def align_to_line(self, wave):
         """Wyrównuje współrzędne y punktów do y danego Wave."""
-        for i in range(len(self)):
-            self.data_y[i] = wave.value_at(self.data_x[i])
+        data = self._joined_data()
+        self._set_data((data[0], wave.value_at_many(data[0])) + data[2:])
 
     def move_in_time(self, time):
         """Przesuwa punkty w czasie."""
-        for i in range(len(self)):
-            self.data_x[i] += time
+        data = self._joined_data()
+        self._set_data((data[0] + time,) + data[1:])
 
-class Parameter():
+class Parameter(_VersionedData):
     """Parameter jest klasą odpowiadającą za przechowywanie kilku 
     obliczonych wartości parametru tego zamego typu, wraz z informacjami
     czasowymi w formie list początkowych i końcowych czasów. Parametry 
@@ -338,6 +2370,11 @@ class Parameter():
         self.parmaeter_begin_times - tablica czasów początkowych parametrów
         self.parameter_end_times - tablica czasów końcowych parametrów
         self.parameter_values - tablica wartości parametru
+
+    Do wyszukiwania wartości obejmujących dany czas służy indeks
+    przedziałów - narastające maksimum czasów końcowych (przy
+    posortowanych czasach początkowych). Jest on budowany przy pierwszym
+    zapytaniu po zmianie tablic.
     """
 
     def __init__(self, parameter_type):
@@ -348,20 +2385,106 @@ class Parameter():
 
     @classmethod
     def fromParameter(cls, parameter):
+        """Zwraca kopię danego Parameter. Tablice są współdzielone z
+        oryginałem, ponieważ add_value zawsze tworzy nowe tablice
+        (copy-on-write).
+        """
         out = cls(parameter.type)
-        out.begin_times = np.copy(parameter.begin_times)
-        out.end_times = np.copy(parameter.end_times)
-        out.values = np.copy(parameter.values)
+        out.begin_times = parameter.begin_times
+        out.end_times = parameter.end_times
+        out.values = parameter.values
+        out.version = parameter.version
+        return out
+
+    @classmethod
+    def fromArrays(cls, begin_times, end_times, values, parameter_type):
+        """Tworzy Parameter z tablic czasów początkowych, końcowych
+        i wartości naraz, sortując je według czasów początkowych.
+        """
+        out = cls(parameter_type)
+        out.add_values(begin_times, end_times, values)
         return out
 
     def copy(self):
         return Parameter.fromParameter(self)
 
+    def _snapshot(self):
+        """Nadpisuje _VersionedData._snapshot. Migawka współdzieli
+        tablice z self, a tablice obu obiektów stają się widokami tylko
+        do odczytu. Metody Parameter zawsze tworzą nowe tablice, więc
+        nadal działają, a bezpośredni zapis do tablic (np. 
+        parameter.values[0] = 99) zgłosi błąd zamiast zmienić migawkę.
+        """
+        for name in ('begin_times', 'end_times', 'values'):
+            setattr(self, name, _read_only(getattr(self, name)))
+        return self.copy()
+
     def __len__(self):
         return len(self.begin_times)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_interval_index', None)
+        state.pop('_listeners', None)
+        state.pop('_last_snapshot', None)
+        return state
+
+    def _max_end_times(self):
+        """Zwraca tablicę, której i-ty element to największy czas
+        końcowy spośród wartości 0..i. Tablica jest niemalejąca, więc
+        wszystkie wartości przed searchsorted(tablica, t) kończą się
+        przed czasem t.
+        """
+        index = self.__dict__.get('_interval_index')
+        # Tablice są zawsze zastępowane nowymi, nigdy modyfikowane w 
+        # miejscu, więc wystarczy sprawdzić czy to wciąż ta sama tablica
+        if index is None or index[0] is not self.end_times:
+            index = (self.end_times, np.maximum.accumulate(self.end_times))
+            self._interval_index = index
+        return index[1]
+
+    def time_span(self):
+        """Zwraca początek pierwszej i najpóźniejszy koniec wartości
+        parametru lub None, jeśli parametr nie ma wartości.
+        """
+        if len(self) == 0:
+            return None
+        return self.begin_times[0], self._max_end_times()[-1]
+
+    def window(self, begin_time, end_time):
+        """Zwraca Parameter z wartościami mającymi część wspólną
+        z zakresem czasu <begin_time; end_time>. Jeśli to możliwe,
+        tablice zwróconego Parameter są widokami tablic self. Jeśli
+        żadna wartość nie leży w zakresie, zwraca None.
+        """
+        first_i, end_i = self._candidate_range(begin_time, end_time)
+        selection = slice(first_i, end_i)
+        overlapping = self.end_times[selection] >= begin_time
+        if not np.all(overlapping):
+            selection = first_i + np.flatnonzero(overlapping)
+        if len(self.begin_times[selection]) == 0:
+            return None
+        out = Parameter(self.type)
+        out.begin_times = self.begin_times[selection]
+        out.end_times = self.end_times[selection]
+        out.values = self.values[selection]
+        out.version = self.version
+        return out
+
+    def _candidate_range(self, begin_time, end_time):
+        """Zwraca zakres indeksów wartości, wśród których są wszystkie
+        wartości mające część wspólną z przedziałem <begin_time; 
+        end_time>. Wartości spoza zakresu na pewno jej nie mają.
+        """
+        if len(self) == 0:
+            return 0, 0
+        first_i = np.searchsorted(self._max_end_times(), begin_time)
+        end_i = np.searchsorted(self.begin_times, end_time, side='right')
+        return int(first_i), int(max(first_i, end_i))
+
     def add_value(self, begin_time, end_time, value):
         """Dodaje wartość parametru obliczoną w danym czasie"""
+        self._check_writable()
         if len(self)==0: 
             self.begin_times = np.append(self.begin_times, begin_time)
             self.end_times = np.append(self.end_times, end_time)
@@ -371,19 +2494,35 @@ class Parameter():
             self.begin_times = np.insert(self.begin_times, i, begin_time)
             self.end_times = np.insert(self.end_times, i, end_time)
             self.values = np.insert(self.values, i, value)
+        self._changed()
+
+    def add_values(self, begin_times, end_times, values):
+        """Dodaje wiele wartości parametru naraz. Nowe wartości są
+        scalane z posiadanymi w jednym przebiegu (złączenie tablic
+        i jedno stabilne sortowanie), a nie wstawiane po kolei.
+        """
+        self._check_writable()
+        begin_times = np.concatenate((self.begin_times, 
+                                      np.asarray(begin_times, dtype=float)))
+        end_times = np.concatenate((self.end_times, 
+                                    np.asarray(end_times, dtype=float)))
+        values = np.concatenate((self.values, np.asarray(values)))
+        if not (len(begin_times) == len(end_times) == len(values)):
+            raise ValueError('Tablice czasów i wartości parametru mają '
+                             'różne długości')
+        order = np.argsort(begin_times, kind='stable')
+        self.begin_times = begin_times[order]
+        self.end_times = end_times[order]
+        self.values = values[order]
+        self._changed()
 
     def contained_in(self, time):
         """Zwraca indeksy wartości parametru, które zawierają dany punkt
         czasu w sobie.
         """
-        contained_indices = []
-        for index, begin_time, end_time in zip(range(len(self)),self.begin_times,
-                                        self.end_times):
-            if time >= begin_time and time <= end_time:
-                contained_indices.append(index)
-            elif time > begin_time:
-                break
-        return contained_indices
+        first_i, end_i = self._candidate_range(time, time)
+        contained = self.end_times[first_i:end_i] >= time
+        return first_i + np.flatnonzero(contained)
 
     def value_at(self, time):
         """Zwraca wartość parametru w danym czasie."""
@@ -393,23 +2532,187 @@ class Parameter():
         else:
             return np.average(self.values[parameter_indices])
 
+    def value_at_many(self, times):
+        """Zwraca tablicę wartości parametru w danych czasach, jak
+        value_at, ale dla całej tablicy czasów naraz. W czasach, w 
+        których parametr nie ma wartości, zwracane jest NaN.
+
+        Dla każdego czasu przeglądane są tylko wartości z zakresu 
+        _candidate_range, a sumowane tylko te, które go obejmują, więc
+        wartość NaN (np. tętno z okna z jednym R) psuje tylko czasy,
+        które sama obejmuje - jak w value_at.
+        """
+        times = np.asarray(times, dtype=float)
+        output = np.full(times.size, np.nan)
+        if len(self) == 0:
+            return output.reshape(times.shape)
+        flat_times = times.ravel()
+        first_i = np.searchsorted(self._max_end_times(), flat_times)
+        end_i = np.maximum(np.searchsorted(self.begin_times, flat_times,
+                                           side='right'), first_i)
+        # Rozwijamy zakresy kandydatów w pary (indeks czasu, indeks
+        # wartości)
+        lengths = end_i - first_i
+        time_ids = np.repeat(np.arange(len(flat_times)), lengths)
+        range_starts = np.cumsum(lengths) - lengths
+        value_ids = (np.arange(lengths.sum())
+                     - np.repeat(range_starts, lengths)
+                     + np.repeat(first_i, lengths))
+        contained = self.end_times[value_ids] >= flat_times[time_ids]
+        time_ids = time_ids[contained]
+        value_ids = value_ids[contained]
+        counts = np.bincount(time_ids, minlength=len(flat_times))
+        sums = np.bincount(time_ids, weights=self.values[value_ids],
+                           minlength=len(flat_times))
+        covered = counts > 0
+        output[covered] = sums[covered] / counts[covered]
+        return output.reshape(times.shape)
+
+    def to_wave(self, sample_rate, begin_time=None, end_time=None,
+                reduction='mean'):
+        """Zwraca Wave z wartościami parametru próbkowanymi z daną
+        częstotliwością w zakresie <begin_time; end_time). W próbkach,
+        w których parametr nie ma wartości, jest NaN. Jeśli parametr
+        nie ma żadnych wartości (jak time_span) lub zakres jest krótszy
+        niż pół okresu próbkowania (nie zawiera żadnej próbki), zwraca
+        None.
+
+        Argumenty:
+        sample_rate - częstotliwość próbkowania zwróconego Wave
+        begin_time - początek zakresu; domyślnie początek pierwszej 
+                     wartości parametru
+        end_time - koniec zakresu; domyślnie najpóźniejszy koniec
+                   wartości parametru
+        reduction - jak łączyć kilka wartości obejmujących tę samą
+                    próbkę: 'mean' (średnia, jak w value_at), 'last'
+                    (wartość rozpoczęta najpóźniej) lub 'max'
+        """
+        if reduction not in ('mean', 'last', 'max'):
+            raise ValueError('Nieznany sposób łączenia wartości %s' 
+                             % reduction)
+        if len(self) == 0:
+            return None
+        if begin_time is None:
+            begin_time = self.begin_times[0]
+        if end_time is None:
+            end_time = self._max_end_times()[-1]
+        sample_count = int(round((end_time-begin_time) * sample_rate))
+        if sample_count <= 0:
+            return None
+        times = begin_time + np.arange(sample_count) / sample_rate
+        if reduction == 'mean':
+            data = self.value_at_many(times)
+        else:
+            # Każda wartość obejmuje ciągły zakres próbek; rozwijamy
+            # te zakresy w pary (indeks wartości, indeks próbki)
+            first_samples = np.searchsorted(times, self.begin_times)
+            end_samples = np.searchsorted(times, self.end_times, 
+                                          side='right')
+            lengths = np.maximum(end_samples-first_samples, 0)
+            value_ids = np.repeat(np.arange(len(self)), lengths)
+            range_starts = np.cumsum(lengths) - lengths
+            sample_ids = (np.arange(lengths.sum())
+                          - np.repeat(range_starts, lengths)
+                          + np.repeat(first_samples, lengths))
+            if reduction == 'last':
+                last_ids = np.full(sample_count, -1)
+                np.maximum.at(last_ids, sample_ids, value_ids)
+                data = np.full(sample_count, np.nan)
+                covered = last_ids >= 0
+                data[covered] = self.values[last_ids[covered]]
+            else:
+                data = np.full(sample_count, np.nan)
+                np.fmax.at(data, sample_ids, self.values[value_ids])
+        return Wave(data, sample_count/sample_rate, self.type, 
+                    offset=begin_time)
+
     def generate_parameter_line_tuples(self, begin_time=None, end_time=None):
         """Zwraca tuple wartości x i y w układzie współrzędnych, by
         później mogły one zostać wizualizowane.
         """
         line_tuples = []
-        for param_begin_time, param_end_time, value in zip(self.begin_times,
-                                                           self.end_times,
-                                                           self.values):
+        # Indeks przedziałów ogranicza pętlę do wartości, które mogą
+        # mieć część wspólną z żądanym zakresem
+        first_i, end_i = self._candidate_range(
+            -np.inf if begin_time is None else begin_time,
+            np.inf if end_time is None else end_time)
+        for param_begin_time, param_end_time, value in zip(
+                self.begin_times[first_i:end_i],
+                self.end_times[first_i:end_i],
+                self.values[first_i:end_i]):
             if begin_time is not None and param_end_time < begin_time:
                 continue
-            if end_time is not None and param_begin_time > end_time:
-                break
-            temp_begin_time = max(begin_time, param_begin_time)
-            temp_end_time = min(end_time, param_end_time)
+            temp_begin_time = param_begin_time
+            if begin_time is not None:
+                temp_begin_time = max(begin_time, param_begin_time)
+            temp_end_time = param_end_time
+            if end_time is not None:
+                temp_end_time = min(end_time, param_end_time)
             line_tuples.append(((temp_begin_time, temp_end_time),(value, value)))
         return line_tuples
 
+class _MemberDict(dict):
+    """dict przechowujący Wave, Points lub Parameter w Composite_data.
+    Informuje Composite_data o dodaniu i usunięciu elementów (wraz 
+    z rodzajem danych, np. 'waves', i etykietą), by mogło ono 
+    obserwować ich zmiany.
+    """
+
+    def __init__(self, owner, kind, items=()):
+        super().__init__()
+        self._owner = owner
+        self._kind = kind
+        self.update(items)
+
+    def __reduce__(self):
+        # Zapisywany jest jako zwykły dict; Composite_data opakowuje go
+        # z powrotem przy wczytywaniu
+        return (dict, (dict(self),))
+
+    def __setitem__(self, key, value):
+        self._owner._check_writable()
+        old_value = self.get(key)
+        super().__setitem__(key, value)
+        if old_value is not None:
+            self._owner._member_removed(self._kind, key, old_value)
+        self._owner._member_added(self._kind, key, value)
+
+    def __delitem__(self, key):
+        self._owner._check_writable()
+        old_value = self[key]
+        super().__delitem__(key)
+        self._owner._member_removed(self._kind, key, old_value)
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super().pop(key, *default)
+        self._owner._check_writable()
+        value = super().pop(key)
+        self._owner._member_removed(self._kind, key, value)
+        return value
+
+    def popitem(self):
+        self._owner._check_writable()
+        key, value = super().popitem()
+        self._owner._member_removed(self._kind, key, value)
+        return key, value
+
+    def clear(self):
+        self._owner._check_writable()
+        items = list(self.items())
+        super().clear()
+        for key, value in items:
+            self._owner._member_removed(self._kind, key, value)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
 class Composite_data:
     """Obiekt przchowujący komplet Wave, Points oraz Parameter
     który pozwala na przeprowadzanie operacji na nich wszystkich
@@ -420,9 +2723,29 @@ class Composite_data:
         self.waves
         self.points
         self.parameters
+
+    Zakresy czasowe wszystkich danych są zapamiętywane. Po dodaniu,
+    usunięciu lub zmianie któregoś z obiektów (Composite_data obserwuje
+    zmiany ich wersji) odświeżany jest tylko zakres tego obiektu, 
+    a zakres całości liczony jest od nowa tylko wtedy, gdy obiekt
+    wyznaczał jego granicę i się z niej cofnął. Razem z nimi 
+    utrzymywany jest wspólny indeks przedziałów czasu wszystkich danych
+    (przebiegów z podziałem na odcinki bez przerw, zakresów punktów
+    i parametrów), z którego korzystają covering_waves oraz 
+    members_in_range; przy zapytaniu uaktualniane są w nim tylko wpisy
+    obiektów zmienionych od poprzedniego zapytania.
+
+    Composite_data.version rośnie przy każdym dodaniu, usunięciu lub
+    zmianie któregoś z obiektów. Niezmienną migawkę wszystkich danych,
+    np. dla analizy w tle podczas edycji, zwraca snapshot.
     """
 
+    # Patrz _VersionedData
+    version = 0
+    frozen = False
+
     def __init__(self, waves=None, points=None, parameters=None):
+        self._reset_time_spans()
         self.waves = {}
         self.points = {}
         self.parameters = {}
@@ -433,36 +2756,474 @@ class Composite_data:
         if parameters is not None:
             self.parameters = parameters
 
-    def calculate_complete_time_span(self):
-        """Zwraca początek oraz koniec zakresu czasowego w sekundach,
-        na długości którego dostępne są dane jakiekogolwiek przebiegu.
+    def _set_members(self, name, members):
+        """Zastępuje jeden z dict danych, opakowując go w _MemberDict.
         """
-        begin_time = None
-        end_time = None
-        for key, wave in self.waves.items():
+        self._check_writable()
+        old_members = self.__dict__.pop(name, None)
+        if old_members is not None:
+            for key, member in old_members.items():
+                self._member_removed(name[1:], key, member)
+        self.__dict__[name] = _MemberDict(self, name[1:], members)
+
+    waves = property(lambda self: self._waves,
+                     lambda self, waves: self._set_members('_waves', waves))
+    points = property(lambda self: self._points,
+                      lambda self, points: self._set_members('_points', 
+                                                             points))
+    parameters = property(lambda self: self._parameters,
+                          lambda self, parameters: self._set_members(
+                              '_parameters', parameters))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Zakresy czasowe odtwarzane są przy wczytywaniu (patrz 
+        # _reset_time_spans)
+        for name in ('_time_spans', '_member_keys', '_label_ids',
+                     '_labels', '_stale_labels'):
+            state.pop(name, None)
+        state.pop('_last_snapshot', None)
+        return state
+
+    def __setstate__(self, state):
+        for name in ('_time_spans', '_member_keys', '_label_ids',
+                     '_labels', '_stale_labels'):
+            state.pop(name, None)
+        self._reset_time_spans()
+        # Starsze Composite_data zapisywały dict danych pod nazwami bez
+        # podkreślenia
+        for name in ('waves', 'points', 'parameters'):
+            members = state.pop('_'+name, state.pop(name, {}))
+            setattr(self, name, members)
+        self.__dict__.update(state)
+
+    def _reset_time_spans(self):
+        """Tworzy puste zapamiętane zakresy czasowe."""
+        empty = np.empty(0)
+        self._time_spans = {'waves': {}, 'points': {}, 'parameters': {},
+                            'complete': (None, None),
+                            'index': (empty, empty, empty,
+                                      np.empty(0, dtype=int))}
+        # Numery par (rodzaj danych, etykieta) w indeksie (patrz 
+        # _label_id) oraz pary, których wpisy w indeksie są nieaktualne
+        self._label_ids = {}
+        self._labels = []
+        self._stale_labels = set()
+        # id obiektu -> zbiór par (rodzaj danych, etykieta), pod którymi
+        # jest przechowywany; ten sam obiekt może być przechowywany pod
+        # kilkoma etykietami
+        self._member_keys = {}
+
+    def _member_added(self, kind, key, member):
+        member._add_listener(self)
+        self._member_keys.setdefault(id(member), set()).add((kind, key))
+        self._update_time_span(kind, key, member)
+        self.version = next(_version_counter)
+
+    def _member_removed(self, kind, key, member):
+        labels = self._member_keys.get(id(member), set())
+        labels.discard((kind, key))
+        if len(labels) == 0:
+            self._member_keys.pop(id(member), None)
+            member._remove_listener(self)
+        self._update_time_span(kind, key, None)
+        self.version = next(_version_counter)
+
+    def _member_changed(self, member):
+        for kind, key in self._member_keys.get(id(member), ()):
+            self._update_time_span(kind, key, member)
+        self.version = next(_version_counter)
+
+    def _update_time_span(self, kind, key, member):
+        """Odświeża zapamiętany zakres czasowy danych o etykiecie key
+        (member to obecnie przechowywany pod nią obiekt lub None) oraz
+        zakres czasowy całości.
+        """
+        time_spans = self._time_spans
+        old_span = time_spans[kind].pop(key, None)
+        new_span = None if member is None else member.time_span()
+        if new_span is not None:
+            time_spans[kind][key] = new_span
+        self._stale_labels.add((kind, key))
+        if kind == 'parameters' or time_spans['complete'] is None:
+            return
+        begin_time, end_time = time_spans['complete']
+        if old_span is not None and (
+                (old_span[0] <= begin_time 
+                 and (new_span is None or new_span[0] > old_span[0]))
+                or (old_span[1] >= end_time
+                    and (new_span is None or new_span[1] < old_span[1]))):
+            # Obiekt wyznaczał granicę zakresu i się z niej cofnął
+            time_spans['complete'] = None
+        elif new_span is not None:
             if begin_time is None:
-                begin_time = wave.offset
+                time_spans['complete'] = new_span
             else:
-                begin_time = min(wave.offset, begin_time)
-            if end_time is None:
-                end_time = wave.offset + wave.complete_length
-            else:
-                end_time = max(wave.offset + wave.complete_length,
-                               end_time)
-        for key, points in self.points.items():
+                time_spans['complete'] = (min(begin_time, new_span[0]),
+                                          max(end_time, new_span[1]))
+
+    def _check_writable(self):
+        if self.frozen:
+            raise SnapshotError('Migawka danych nie może być modyfikowana')
+
+    def snapshot(self):
+        """Zwraca niezmienne Composite_data z migawkami wszystkich
+        danych (patrz _VersionedData.snapshot), o tej samej wersji.
+        Migawki współdzielą tablice (a Points również bloki punktów)
+        z oryginałami, więc mogą być czytane np. w osobnym wątku, 
+        podczas gdy oryginał jest dalej modyfikowany. Dopóki dane się
+        nie zmienią, kolejne wywołania zwracają tę samą migawkę.
+        """
+        if self.frozen:
+            return self
+        cached = self.__dict__.get('_last_snapshot')
+        if cached is not None:
+            version, reference = cached
+            snapshot = reference()
+            if snapshot is not None and version == self.version:
+                return snapshot
+        snapshot = Composite_data(
+            waves={key: wave.snapshot() 
+                   for key, wave in self.waves.items()},
+            points={key: points.snapshot()
+                    for key, points in self.points.items()},
+            parameters={key: parameter.snapshot()
+                        for key, parameter in self.parameters.items()})
+        snapshot.version = self.version
+        snapshot.frozen = True
+        self.__dict__['_last_snapshot'] = (self.version,
+                                           weakref.ref(snapshot))
+        return snapshot
+
+    def _calculate_time_spans(self):
+        """Zwraca zapamiętane zakresy czasowe wszystkich danych, 
+        uzupełniając zakres całości i indeks, jeśli były nieaktualne.
+        """
+        time_spans = self._time_spans
+        if time_spans['complete'] is None:
+            time_spans['complete'] = self._calculate_complete_span(
+                time_spans)
+        self._update_time_index(time_spans)
+        return time_spans
+
+    def _calculate_complete_span(self, time_spans):
+        """Oblicza zakres czasowy całości z zakresów przebiegów
+        i punktów.
+        """
+        begin_time = None
+        end_time = None
+        for member_begin, member_end in itertools.chain(
+                time_spans['waves'].values(), 
+                time_spans['points'].values()):
             if begin_time is None:
-                begin_time = points.data_x[0]
+                begin_time = member_begin
             else:
-                begin_time = min(points.data_x[0], begin_time)
+                begin_time = min(member_begin, begin_time)
             if end_time is None:
-                end_time = points.data_x[-1]
+                end_time = member_end
             else:
-                end_time = max(points.data_x[-1],
-                               end_time)
+                end_time = max(member_end, end_time)
         if begin_time and end_time is None:
             begin_time = 0
         return begin_time, end_time
 
+    def _label_id(self, label):
+        """Zwraca numer pary (rodzaj danych, etykieta), pod którym jej
+        przedziały zapisywane są w indeksie przedziałów czasu.
+        """
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = len(self._labels)
+            self._label_ids[label] = label_id
+            self._labels.append(label)
+        return label_id
+
+    def _update_time_index(self, time_spans):
+        """Uaktualnia indeks przedziałów czasu wszystkich danych: tablice
+        początków (posortowanych), końców, narastającego maksimum końców
+        oraz numerów etykiet danych (patrz _label_id), do których należą
+        przedziały. Przedziały zawierające dany zakres zaczynają się nie
+        później niż on, a wszystkie przedziały przed 
+        searchsorted(maksima, t) kończą się przed t, więc zapytania 
+        wymagają tylko wyszukiwania binarnego i przejrzenia przedziałów
+        pomiędzy tymi granicami.
+
+        Odczytywane są na nowo tylko przedziały danych zmienionych od 
+        ostatniej aktualizacji; ich stare wpisy są usuwane, a nowe 
+        wstawiane w miejsca wskazane przez wyszukiwanie binarne. Maksima
+        końców liczone są ponownie od pierwszego zmienionego wpisu.
+        """
+        stale_labels = self._stale_labels
+        if len(stale_labels) == 0:
+            return
+        self._stale_labels = set()
+        begins, ends, max_ends, label_ids = time_spans['index']
+        removed = np.isin(label_ids, [self._label_id(label)
+                                      for label in stale_labels])
+        first_i = len(begins)
+        if np.any(removed):
+            first_i = np.flatnonzero(removed)[0]
+            begins = begins[~removed]
+            ends = ends[~removed]
+            label_ids = label_ids[~removed]
+        new_begins = []
+        new_ends = []
+        new_label_ids = []
+        for kind, key in stale_labels:
+            if key not in time_spans[kind]:
+                continue
+            if kind == 'waves':
+                label_begins, label_ends = self.waves[key].coverage()
+            else:
+                begin_time, end_time = time_spans[kind][key]
+                label_begins, label_ends = [begin_time], [end_time]
+            new_begins.append(np.asarray(label_begins, dtype=float))
+            new_ends.append(np.asarray(label_ends, dtype=float))
+            new_label_ids.append(np.full(len(label_begins),
+                                         self._label_id((kind, key))))
+        if len(new_begins) > 0:
+            new_begins = np.concatenate(new_begins)
+            order = np.argsort(new_begins, kind='stable')
+            new_begins = new_begins[order]
+            positions = np.searchsorted(begins, new_begins, side='right')
+            begins = np.insert(begins, positions, new_begins)
+            ends = np.insert(ends, positions, 
+                             np.concatenate(new_ends)[order])
+            label_ids = np.insert(label_ids, positions,
+                                  np.concatenate(new_label_ids)[order])
+            first_i = min(first_i, positions[0])
+        # Wpisy przed first_i nie zmieniły się, podobnie jak ich maksima
+        tail_max_ends = np.maximum.accumulate(ends[first_i:])
+        if first_i > 0:
+            tail_max_ends = np.maximum(tail_max_ends, max_ends[first_i-1])
+        max_ends = np.concatenate((max_ends[:first_i], tail_max_ends))
+        time_spans['index'] = (begins, ends, max_ends, label_ids)
+
+    def _query_time_index(self, first_time, last_time, begin_time, 
+                          end_time):
+        """Zwraca rodzaje i etykiety danych, których przedziały zaczynają
+        się nie później niż first_time i kończą nie wcześniej niż 
+        last_time, a przy tym mają część wspólną z <begin_time; 
+        end_time>.
+        """
+        index = self._calculate_time_spans()['index']
+        begins, ends, max_ends, label_ids = index
+        first_i = np.searchsorted(max_ends, max(last_time, begin_time))
+        end_i = np.searchsorted(begins, min(first_time, end_time), 
+                                side='right')
+        found = first_i + np.flatnonzero(ends[first_i:end_i] >= last_time)
+        labels = [self._labels[label_id] for label_id in label_ids[found]]
+        return ([kind for kind, _ in labels], [key for _, key in labels])
+
+    def covering_waves(self, begin_time, end_time):
+        """Zwraca listę etykiet przebiegów, które mają dane (bez 
+        przerw) na całym zakresie czasu <begin_time; end_time>.
+        """
+        kinds, keys = self._query_time_index(begin_time, end_time,
+                                             begin_time, end_time)
+        return [key for kind, key in zip(kinds, keys) if kind == 'waves']
+
+    def members_in_range(self, begin_time, end_time):
+        """Zwraca dict 'waves'/'points'/'parameters' -> lista etykiet
+        danych mających cokolwiek w zakresie czasu <begin_time; 
+        end_time>: przebiegi z danymi w tym zakresie, zestawy punktów
+        z choć jednym punktem w <begin_time; end_time) oraz parametry
+        z choć jedną wartością w zakresie.
+        """
+        kinds, keys = self._query_time_index(end_time, begin_time,
+                                             begin_time, end_time)
+        members = {'waves': [], 'points': [], 'parameters': []}
+        for kind, key in zip(kinds, keys):
+            # Indeks zawiera cały zakres punktów i parametrów, więc
+            # trzeba jeszcze sprawdzić, czy zakres nie trafia w przerwę
+            # między nimi
+            if kind == 'points':
+                if self.points[key].slice_range(begin_time, 
+                                                end_time) is None:
+                    continue
+            elif kind == 'parameters':
+                first_i, end_i = self.parameters[key]._candidate_range(
+                    begin_time, end_time)
+                if not np.any(self.parameters[key].end_times[first_i:end_i]
+                              >= begin_time):
+                    continue
+            if key not in members[kind]:
+                members[kind].append(key)
+        return members
+
+    def time_spans(self, data_kind='waves'):
+        """Zwraca dict etykieta -> (początek, koniec) zakresów 
+        czasowych danych jednego rodzaju: 'waves', 'points' lub
+        'parameters'. Zwrócony dict nie powinien być modyfikowany.
+        """
+        return self._calculate_time_spans()[data_kind]
+
+    def copy(self):
+        """Zwraca kopię Composite_data z kopiami wszystkich danych.
+        Kopie współdzielą tablice z oryginałami aż do ich modyfikacji.
+        """
+        return Composite_data(
+            waves={key: wave.copy() for key, wave in self.waves.items()},
+            points={key: points.copy()
+                    for key, points in self.points.items()},
+            parameters={key: parameter.copy()
+                        for key, parameter in self.parameters.items()})
+
+    def window(self, begin_time, end_time):
+        """Zwraca Composite_data z danymi ograniczonymi do zakresu 
+        czasu <begin_time; end_time> (patrz Wave.window, Points.window
+        i Parameter.window). Dane nie są kopiowane, a czasy pozostają
+        takie same jak w self. Obiekty nie mające danych w zakresie
+        są pomijane.
+        """
+        windows = []
+        for members in (self.waves, self.points, self.parameters):
+            windows.append({})
+            for key, member in members.items():
+                member_window = member.window(begin_time, end_time)
+                if member_window is not None:
+                    windows[-1][key] = member_window
+        return Composite_data(waves=windows[0], points=windows[1],
+                              parameters=windows[2])
+
+    def sliding_windows(self, size, step, waves=None, points=None,
+                        begin_time=None, end_time=None):
+        """Dzieli zakres czasu na okna o długości size sekund 
+        zaczynające się co step sekund i zwraca je wszystkie naraz jako
+        tablice.
+
+        Zwraca krotkę:
+        begin_times - tablica czasów początkowych okien
+        wave_windows - dict etykieta -> tablica (okna x punkty okna)
+                       wartości przebiegu (patrz Wave.sliding_windows)
+        point_ranges - dict etykieta -> para tablic indeksów 
+                       początkowych i końcowych (bez końca) punktów 
+                       w kolejnych oknach, jak w Points.slice_range
+
+        Argumenty:
+        waves - etykiety przebiegów; domyślnie wszystkie. Przebiegi
+                muszą mieć regularne próbkowanie (nie mogą być 
+                IrregularWave)
+        points - etykiety punktów; domyślnie wszystkie
+        begin_time, end_time - zakres czasu; domyślnie zakres, w którym
+                               dostępne są wszystkie wybrane przebiegi
+        """
+        if waves is None:
+            waves = list(self.waves)
+        if points is None:
+            points = list(self.points)
+        if len(waves) > 0:
+            default_begin, default_end = self.calculate_time_range(waves)
+        else:
+            default_begin, default_end = self.calculate_complete_time_span()
+        if begin_time is None:
+            begin_time = default_begin
+        if end_time is None:
+            end_time = default_end
+        # Tolerancja na błędy zaokrągleń, by okno kończące się dokładnie
+        # na end_time nie zostało pominięte
+        window_count = int(np.floor((end_time-begin_time-size)/step 
+                                    + 1e-9)) + 1
+        begin_times = begin_time + np.arange(max(window_count, 0))*step
+        wave_windows = {key: self.waves[key].sliding_windows(begin_times, 
+                                                             size)
+                        for key in waves}
+        point_ranges = {}
+        for key in points:
+            data_x = self.points[key].data_x
+            point_ranges[key] = (np.searchsorted(data_x, begin_times),
+                                 np.searchsorted(data_x, begin_times+size))
+        return begin_times, wave_windows, point_ranges
+
+    def iter_windows(self, size, step, waves=None, points=None,
+                     begin_time=None, end_time=None):
+        """Generator kolejnych okien czasu, jak w sliding_windows.
+        Dla każdego okna zwraca krotkę: czas początkowy okna, dict 
+        etykieta -> wartości przebiegu w oknie (widok tablicy
+        z sliding_windows) oraz dict etykieta -> range indeksów punktów
+        w oknie.
+        """
+        begin_times, wave_windows, point_ranges = self.sliding_windows(
+            size, step, waves=waves, points=points, 
+            begin_time=begin_time, end_time=end_time)
+        for i, window_begin_time in enumerate(begin_times):
+            yield (window_begin_time,
+                   {key: windows[..., i, :] 
+                    for key, windows in wave_windows.items()},
+                   {key: range(begins[i], ends[i])
+                    for key, (begins, ends) in point_ranges.items()})
+
+    def _aligned_range(self, wave_keys, sample_rate, begin_time, end_time):
+        """Zwraca zakres <first_k; end_k) punktów wspólnej siatki czasu
+        k/sample_rate dla align_waves i iter_aligned.
+        """
+        if len(wave_keys) == 0:
+            raise ValueError('Nie wybrano żadnych przebiegów')
+        default_begin, default_end = self.calculate_time_range(wave_keys)
+        if begin_time is None:
+            begin_time = default_begin
+        if end_time is None:
+            end_time = default_end
+        return (int(np.ceil(begin_time*sample_rate - 1e-9)),
+                int(np.ceil(end_time*sample_rate - 1e-9)))
+
+    def align_waves(self, wave_keys, sample_rate, begin_time=None,
+                    end_time=None, method='poly'):
+        """Przepróbkowuje przebiegi o podanych etykietach do wspólnej
+        siatki czasu o częstotliwości sample_rate (patrz 
+        Wave.resampled), niezależnie od ich częstotliwości i przesunięć
+        w czasie.
+
+        Zwraca krotkę: tablicę czasów punktów siatki oraz dict 
+        etykieta -> tablica wartości przebiegu w tych punktach (tylko do
+        odczytu). Przebieg jest zapamiętywany tylko wtedy, gdy zakres
+        obejmuje całą jego siatkę; krótsze zakresy są liczone osobno, 
+        a jeśli przebieg został już zapamiętany - wycinane z gotowej
+        tablicy (patrz Wave.resampled).
+
+        Argumenty:
+        begin_time, end_time - zakres czasu; domyślnie zakres, w którym
+                               dostępne są wszystkie wybrane przebiegi
+        method - jak w Wave.resampled
+        """
+        first_k, end_k = self._aligned_range(wave_keys, sample_rate,
+                                             begin_time, end_time)
+        aligned = {}
+        for key in wave_keys:
+            # Cały przebieg jest zapamiętywany tylko wtedy, gdy zakres
+            # obejmuje całą jego siatkę (patrz Wave.resampled)
+            aligned[key] = self.waves[key].resampled(
+                sample_rate, first_k, end_k, method=method)
+        return np.arange(first_k, end_k) / sample_rate, aligned
+
+    def iter_aligned(self, wave_keys, sample_rate, chunk_length,
+                     begin_time=None, end_time=None, method='poly'):
+        """Generator kolejnych fragmentów o długości chunk_length 
+        sekund przebiegów przepróbkowanych do wspólnej siatki czasu, 
+        jak w align_waves. Fragmenty liczone są osobno, bez 
+        przepróbkowywania całych przebiegów naraz (chyba że zostały
+        już zapamiętane przez align_waves), więc nadaje się to do
+        długich nagrań, np. w np.memmap.
+
+        Dla każdego fragmentu zwraca krotkę: tablicę czasów punktów
+        oraz dict etykieta -> tablica wartości przebiegu.
+        """
+        first_k, end_k = self._aligned_range(wave_keys, sample_rate,
+                                             begin_time, end_time)
+        chunk_size = max(int(round(chunk_length*sample_rate)), 1)
+        for chunk_begin in range(first_k, end_k, chunk_size):
+            chunk_end = min(chunk_begin+chunk_size, end_k)
+            yield (np.arange(chunk_begin, chunk_end) / sample_rate,
+                   {key: self.waves[key].resampled(sample_rate, chunk_begin,
+                                                   chunk_end, method=method)
+                    for key in wave_keys})
+
+    def calculate_complete_time_span(self):
+        """Zwraca początek oraz koniec zakresu czasowego w sekundach,
+        na długości którego dostępne są dane jakiekogolwiek przebiegu.
+        """
+        return self._calculate_time_spans()['complete']
+
     def calculate_time_range(self, required_waves):
         """Zwraca początek oraz koniec zakresu czasowego w sekundach,
         na długości którego dostępne są dane wszystkich wymaganych 
@@ -470,17 +3231,17 @@ class Composite_data:
         """
         begin_time = None
         end_time = None
+        wave_time_spans = self.time_spans('waves')
         for required_wave in required_waves:
-            wave = self.waves[required_wave]
+            wave_begin, wave_end = wave_time_spans[required_wave]
             if begin_time is None:
-                begin_time = wave.offset
+                begin_time = wave_begin
             else:
-                begin_time = max(wave.offset, begin_time)
+                begin_time = max(wave_begin, begin_time)
             if end_time is None:
-                end_time = wave.offset + wave.complete_length
+                end_time = wave_end
             else:
-                end_time = min(wave.offset + wave.complete_length,
-                               end_time)
+                end_time = min(wave_end, end_time)
         return begin_time, end_time
 
     def add_wave(self, wave, dict_type, replace=False):
@@ -499,14 +3260,18 @@ class Composite_data:
         """Usuwa przebieg."""
         self.waves.pop(dict_type)
 
-    def add_points(self, points, dict_type, join=False):
-        """Dodaje zestaw punktów."""
+    def add_points(self, points, dict_type, join=False, tolerance=None):
+        """Dodaje zestaw punktów. Jeśli join jest True, a etykieta jest
+        już zajęta, punkty są scalane z istniejącymi (zob. 
+        Points.add_points, również co do argumentu tolerance).
+        """
         # TODO: czy defaultowo join powinno być False?
         if dict_type is None:
             dict_type = points.type
         if dict_type in self.points:
             if join:
-                self.points[dict_type].add_points(points)
+                self.points[dict_type].add_points(points, 
+                                                  tolerance=tolerance)
             else:
                 raise ValueError('Etykieta %s w points jest już zajęta.'
                                  % dict_type)
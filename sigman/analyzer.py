@@ -166,11 +166,16 @@ def calculate_parameter(waves, points, time_tuples,
         and not all(points_ in points for points_ in procedure.required_points)):
         raise ValueError('Nie podano wymaganych punktów z %s'
                          % procedure.required_points)
-    parameter = sm.Parameter(procedure.output_type)
+    begin_times = []
+    end_times = []
+    values = []
     for begin_time, end_time in time_tuples:
         value = procedure.execute(
             waves, points,
             begin_time, end_time,
             arguments)
-        parameter.add_value(begin_time, end_time, value)
-    return parameter
+        begin_times.append(begin_time)
+        end_times.append(end_time)
+        values.append(value)
+    return sm.Parameter.fromArrays(begin_times, end_times, values,
+                                   procedure.output_type)
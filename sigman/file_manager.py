@@ -41,15 +41,49 @@ def _import_dat(file_name):
 
 
 def _import_wave_dat(file_name, wave_type, offset=0):
-    """Importuje przebieg o stałej częstotliwości z pliku .dat i
-    zwraca odpowiadający mu sm.Wave.
+    """Importuje przebieg z pliku .dat i zwraca odpowiadający mu
+    sm.Wave. Jeśli punkty nie są rozłożone równomiernie w czasie (np.
+    z powodu zgubionych pakietów), zwraca sm.IrregularWave, który
+    zachowuje ich czasy.
     """
     x, y = _import_dat(file_name)
+    differences = np.diff(x)
+    if len(differences) > 0:
+        sample_length = np.median(differences)
+        if np.any(np.abs(differences-sample_length) > sample_length/2):
+            return sm.IrregularWave(y, x,
+                                    wave_type = wave_type,
+                                    offset = offset)
     complete_len = x[-1]
     return sm.Wave(y, complete_len, 
                         wave_type = wave_type, 
                         offset = offset)
     
+def import_wave_memmap(file_name, wave_type, sample_rate, dtype='float64',
+                       offset=0, byte_offset=0, mode='c',
+                       value_scale=1, value_offset=0):
+    """Otwiera surowy plik binarny z wartościami przebiegu jako
+    np.memmap i zwraca oparty na nim sm.Wave. Dane nie są wczytywane
+    do pamięci - odczytywane są tylko te fragmenty pliku, których
+    dotyczą zapytania.
+
+    Argumenty:
+    sample_rate - częstotliwość samplowania przebiegu
+    dtype - typ wartości zapisanych w pliku
+    byte_offset - liczba bajtów nagłówka do pominięcia na początku pliku
+    mode - tryb otwarcia np.memmap; domyślnie 'c', w którym zmiany
+           (np. replace_slice) są widoczne tylko w pamięci i nie
+           zmieniają pliku
+    value_scale, value_offset - przeliczenie zapisanych wartości na
+                                jednostki fizyczne (patrz sm.Wave)
+    """
+    data = np.memmap(file_name, dtype=dtype, mode=mode, offset=byte_offset)
+    return sm.Wave(data, len(data)/sample_rate,
+                   wave_type = wave_type,
+                   offset = offset,
+                   value_scale = value_scale,
+                   value_offset = value_offset)
+
 def _import_point_dat(file_name, point_type):
     """Importuje współrzędne punktów z pliku .dat i zwraca odpowiadający
     im sm.Points.
@@ -58,19 +92,24 @@ def _import_point_dat(file_name, point_type):
     return sm.Points(x, y, 
                           point_type = point_type)
 
-def import_wave(file_name, wave_type, offset=0):
+def import_wave(file_name, wave_type, offset=0, dtype=None):
     """Importuje przebieg z danego pliku, przy czym wybiera odpowiednią
-    funkcję do formatu danego pliku.
+    funkcję do formatu danego pliku. Jeśli podano dtype (np. 'float32'
+    lub 'int16'), dane przebiegu są w nim przechowywane (patrz
+    sm.Wave.astype).
     """
     extension = os.path.splitext(file_name)[1][1:]
     if extension == 'dat':
         import_func = _import_wave_dat
     else:
         raise ValueError("Nieodpowiedni format plików")
-    return import_func(
+    wave = import_func(
         file_name, 
         wave_type = wave_type, 
         offset = offset)
+    if dtype is not None:
+        wave = wave.astype(dtype)
+    return wave
 
 def import_points(file_name, point_type):
     """Importuje punkty z danego pliku, przy czym wybiera odpowiednią
@@ -97,6 +136,14 @@ def _export_line_dat(file_name, wave):
     data_x, data_y = wave.generate_coordinate_tables()
     _export_dat(data_x,data_y,file_name)
 
+def _export_line_bin(file_name, wave):
+    """Eksportuje wartości Wave do surowego pliku binarnego, który
+    można później otworzyć za pomocą import_wave_memmap. Zapisywane są
+    wartości w typie, w którym przechowuje je Wave, bez przeliczania
+    na jednostki fizyczne.
+    """
+    np.asarray(wave.data).tofile(file_name)
+
 def _export_point_dat(file_name, points):
     """Eksportuje Points do pliku o formacie .dat."""
     _export_dat(file_name, points.data_x, points.data_y)
@@ -108,6 +155,8 @@ def export_line(file_name, wave):
     extension = os.path.splitext(file_name)[1][1:]
     if extension == 'dat':
         export_func = _export_line_dat
+    elif extension == 'bin':
+        export_func = _export_line_bin
     else:
         raise ValueError("Nieodpowiedni format plików")
     export_func(file_name, wave)
@@ -214,8 +263,10 @@ def import_modelflow_data(file_name, reference_points, reference_points_type):
                 offset = _estimate_points_offset(points, reference_points)
             elif reference_points_type == 'r' and name == 'HR':
                 hr_from_r = _hr_from_r(reference_points.data_x)
-                hr_points = sm.Points(reference_points.data_x, hr_from_r,
-                                      'wyznaczoneHRzR')
+                # HR wyznaczane jest między kolejnymi R, więc jest ich
+                # o jedno mniej niż punktów R
+                hr_points = sm.Points(reference_points.data_x[:-1], hr_from_r,
+                                      'wyznaczoneHRzR', assume_sorted=True)
                 offset = _estimate_points_offset(points, hr_points)
 
     for points in points_list:
@@ -46,7 +46,7 @@ def visualize_composite_data(comp_data, begin_time=None, end_time=None,
                 color = type_colors[wave.type]
             else:
                 color = None
-            plt.plot(x, y, color = color, 
+            plt.plot(x, y.T, color = color, 
                 label = wave.type)
     else:
         for dict_type in wanted_waves:
@@ -59,7 +59,7 @@ def visualize_composite_data(comp_data, begin_time=None, end_time=None,
                 color = type_colors[wave.type]
             else:
                 color = None
-            plt.plot(x, y, color = color, 
+            plt.plot(x, y.T, color = color, 
                 label = wave.type)
     if wanted_points is None:
         for key, points in comp_data.points.items():
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# W tym skrypcie sprawdzane są struktury danych biblioteki sigman
+# (bloki punktów, indeksy statystyk, przebiegi w np.memmap, parametry,
+# Composite_data oraz wyrażenia) przez porównanie ich wyników z wynikami
+# zwykłego numpy
+
+import os
+import tempfile
+
+import numpy as np
+import sigman as sm
+from sigman import file_manager as fm
+
+rng = np.random.default_rng(0)
+
+# Małe rozmiary bloków i kawałków, by sprawdzić obsługę ich granic;
+# oryginalne rozmiary przywracane są na końcu, także gdy któreś ze
+# sprawdzeń się nie powiedzie
+points_block_size = sm.Points.block_size
+statistics_block_size = sm._RangeStatistics.block_size
+expression_chunk_size = sm.WaveExpression.chunk_size
+sm.Points.block_size = 8
+sm._RangeStatistics.block_size = 16
+sm.WaveExpression.chunk_size = 100
+
+try:
+    print(">Próba dodawania punktów pojedynczo (podział bloków)")
+    all_x = rng.permutation(np.arange(400) * 0.25)
+    all_y = rng.normal(size=400)
+    points = sm.Points(all_x[:50], all_y[:50], 'r')
+    for x, y in zip(all_x[50:], all_y[50:]):
+        points.add_point(x, y)
+    order = np.argsort(all_x)
+    expected_x = all_x[order]
+    expected_y = all_y[order]
+    assert len(points._blocks) > 1
+    assert all(len(block[0]) <= 2*points.block_size
+               for block in points._blocks)
+    assert np.array_equal(points.data_x, expected_x)
+    assert np.array_equal(points.data_y, expected_y)
+
+    print(">Próba usuwania punktów zakresami i pojedynczo")
+    for _ in range(20):
+        begin_time = rng.uniform(0, 100)
+        end_time = begin_time + rng.uniform(0, 3)
+        kept = (expected_x < begin_time) | (expected_x >= end_time)
+        if np.all(kept) or not np.any(kept):
+            continue
+        points.delete_slice(begin_time, end_time)
+        expected_x = expected_x[kept]
+        expected_y = expected_y[kept]
+        assert np.array_equal(points.data_x, expected_x)
+        assert np.array_equal(points.data_y, expected_y)
+    for x in rng.uniform(0, 100, 20):
+        i = np.argmin(np.abs(expected_x - x))
+        points.delete_point(x)
+        expected_x = np.delete(expected_x, i)
+        expected_y = np.delete(expected_y, i)
+        assert np.array_equal(points.data_x, expected_x)
+        assert np.array_equal(points.data_y, expected_y)
+
+    print(">Próba odnalezienia najbliższego punktu")
+    for x, y, x_scale, y_scale in zip(rng.uniform(-10, 110, 50),
+                                      rng.normal(size=50),
+                                      rng.uniform(0.1, 10, 50),
+                                      rng.uniform(0.1, 10, 50)):
+        distances = (((expected_x-x)/x_scale)**2
+                     + ((expected_y-y)/y_scale)**2)
+        assert points.closest_point_id(x, y, x_scale=x_scale,
+                                       y_scale=y_scale) == np.argmin(distances)
+
+    print(">Próba obliczenia statystyk na zakresach przebiegu")
+    values = rng.normal(size=5000)
+    wave = sm.Wave(values.copy(), 50, 'bp')
+    def check_statistics():
+        for _ in range(50):
+            begin_time, end_time = np.sort(rng.uniform(0, 50, 2))
+            begin_i = wave.sample_at(begin_time)
+            end_i = wave.sample_at(end_time)
+            if end_i <= begin_i:
+                continue
+            expected = values[begin_i:end_i]
+            assert np.isclose(wave.range_sum(begin_time, end_time),
+                              np.sum(expected))
+            assert np.isclose(wave.range_mean(begin_time, end_time),
+                              np.mean(expected))
+            assert np.isclose(wave.range_var(begin_time, end_time),
+                              np.var(expected))
+            assert wave.range_min(begin_time, end_time) == np.min(expected)
+            assert wave.range_max(begin_time, end_time) == np.max(expected)
+    check_statistics()
+
+    print(">Próba obliczenia statystyk po zmianie fragmentu przebiegu")
+    replacement = rng.normal(scale=5, size=300)
+    wave.replace_slice(10, 13, sm.Wave(replacement, 3, 'bp'))
+    values[1000:1300] = replacement
+    check_statistics()
+
+    print(">Próba obliczenia wariancji wartości odległych od zera")
+    precise_values = 100 + 0.01*rng.standard_normal(1000000)
+    precise_wave = sm.Wave(precise_values, 1000, 'bp')
+    assert np.isclose(precise_wave.range_var(0, 1000), np.var(precise_values),
+                      rtol=1e-6)
+
+    print(">Próba odczytu przebiegu zapisanego w np.memmap")
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'wave.bin')
+        raw_values = rng.integers(-1000, 1000, 2000).astype(np.int16)
+        raw_values.tofile(file_name)
+        mapped = np.memmap(file_name, dtype=np.int16, mode='r')
+        mapped_wave = sm.Wave(mapped, 20, 'bp')
+        assert np.shares_memory(mapped_wave.data, mapped)
+        mapped_slice = mapped_wave.data_slice(3, 7)
+        assert np.shares_memory(mapped_slice, mapped)
+        assert np.array_equal(mapped_slice, raw_values[300:700])
+        times = rng.uniform(0, 19.99, 100)
+        assert np.allclose(mapped_wave.value_at_many(times),
+                           np.interp(times, np.arange(2000)/100, raw_values))
+        assert np.ndim(mapped_wave.value_at(5.005)) == 0
+        assert np.isclose(mapped_wave.value_at(5.005),
+                          (raw_values[500]+raw_values[501]) / 2)
+        scaled_wave = sm.Wave(mapped, 20, 'bp', value_scale=0.5,
+                              value_offset=10)
+        assert np.shares_memory(scaled_wave.data, mapped)
+        assert np.allclose(scaled_wave.data_slice(3, 7),
+                           raw_values[300:700]*0.5 + 10)
+        assert np.isclose(scaled_wave.range_mean(3, 7),
+                          np.mean(raw_values[300:700])*0.5 + 10)
+        del mapped, mapped_wave, mapped_slice, scaled_wave
+
+    print(">Próba odczytu wartości parametru")
+    begin_times = rng.uniform(0, 100, 200)
+    end_times = begin_times + rng.exponential(5, 200)
+    parameter_values = rng.normal(size=200)
+    parameter = sm.Parameter.fromArrays(begin_times[:100], end_times[:100],
+                                        parameter_values[:100], 'hr')
+    parameter.add_values(begin_times[100:], end_times[100:],
+                         parameter_values[100:])
+    times = rng.uniform(-5, 115, 300)
+    for time in times:
+        contained = (begin_times <= time) & (end_times >= time)
+        found = parameter.values[parameter.contained_in(time)]
+        assert np.array_equal(np.sort(found),
+                              np.sort(parameter_values[contained]))
+    contained = ((begin_times[None, :] <= times[:, None])
+                 & (end_times[None, :] >= times[:, None]))
+    counts = np.sum(contained, axis=1)
+    sums = np.sum(contained * parameter_values[None, :], axis=1)
+    expected = np.full(len(times), np.nan)
+    expected[counts > 0] = sums[counts > 0] / counts[counts > 0]
+    assert np.allclose(parameter.value_at_many(times), expected,
+                       equal_nan=True)
+
+    print(">Próba odczytu parametru z wartością NaN")
+    # Np. tętno z okna, w którym był tylko jeden R
+    parameter = sm.Parameter.fromArrays([0, 10, 20, 30], [10, 20, 30, 40],
+                                        [60, np.nan, 70, 80], 'hr')
+    times = np.array([5, 25, 35])
+    assert np.array_equal(parameter.value_at_many(times), [60, 70, 80])
+    assert [parameter.value_at(time) for time in times] == [60, 70, 80]
+    assert np.isnan(parameter.value_at_many([15])[0])
+
+    print(">Próba odczytu parametru o bardzo różnych wartościach")
+    parameter = sm.Parameter.fromArrays([0, 10], [9, 20], [1e17, 1.0], 'x')
+    assert np.array_equal(parameter.value_at_many([5, 15]), [1e17, 1.0])
+
+    print(">Próba próbkowania parametru z wartością NaN")
+    parameter = sm.Parameter.fromArrays([0, 10, 20, 30], [10, 20, 30, 40],
+                                        [60, np.nan, 70, 80], 'hr')
+    parameter_wave = parameter.to_wave(0.2)
+    assert len(parameter_wave) == 8
+    # Wartości stykające się końcami obejmują wspólną próbkę
+    assert np.array_equal(parameter_wave.data,
+                          [60, 60, np.nan, np.nan, np.nan, 70, 75, 80],
+                          equal_nan=True)
+
+    print(">Próba próbkowania parametru na zakresie krótszym od próbki")
+    parameter = sm.Parameter.fromArrays([1.0], [1.2], [60], 'hr')
+    assert parameter.to_wave(1) is None
+    assert len(parameter.to_wave(10)) == 2
+
+    print(">Próba zmiany parametru po utworzeniu migawki")
+    parameter = sm.Parameter.fromArrays([0, 10], [10, 20], [60, 70], 'hr')
+    snapshot = parameter.snapshot()
+    try:
+        parameter.values[0] = 99
+    except ValueError:
+        pass
+    assert np.array_equal(snapshot.values, [60, 70])
+    try:
+        snapshot.values[0] = 99
+    except ValueError:
+        pass
+    assert np.array_equal(snapshot.values, [60, 70])
+    parameter.add_value(20, 30, 80)
+    assert np.array_equal(parameter.values, [60, 70, 80])
+    assert np.array_equal(snapshot.values, [60, 70])
+
+    print(">Próba wyszukania danych w zakresie czasu Composite_data")
+    def random_wave():
+        if rng.uniform() < 0.3:
+            # Przebieg z przerwą w próbkowaniu
+            timestamps = np.sort(rng.uniform(0, 20, 40))
+            timestamps[20:] += 15
+            return sm.IrregularWave(rng.normal(size=40),
+                                    timestamps - timestamps[0], 'ecg',
+                                    offset=rng.uniform(-5, 40))
+        return sm.Wave(rng.normal(size=100), rng.uniform(1, 40), 'bp',
+                       offset=rng.uniform(-5, 40))
+    def check_composite_data(composite_data):
+        all_spans = []
+        for key, member in composite_data.waves.items():
+            time_span = composite_data.time_spans('waves')[key]
+            assert time_span == member.time_span()
+            all_spans.append(member.time_span())
+        for key, member in composite_data.points.items():
+            time_span = composite_data.time_spans('points')[key]
+            assert time_span == member.time_span()
+            all_spans.append(member.time_span())
+        assert composite_data.calculate_complete_time_span() == (
+            min(span[0] for span in all_spans),
+            max(span[1] for span in all_spans))
+        for _ in range(20):
+            begin_time = rng.uniform(-5, 80)
+            end_time = begin_time + rng.uniform(0, 10)
+            covering = []
+            overlapping = []
+            for key, member in composite_data.waves.items():
+                begins, ends = member.coverage()
+                if np.any((begins <= begin_time) & (ends >= end_time)):
+                    covering.append(key)
+                if np.any((begins <= end_time) & (ends >= begin_time)):
+                    overlapping.append(key)
+            assert sorted(composite_data.covering_waves(
+                begin_time, end_time)) == sorted(covering)
+            members = composite_data.members_in_range(begin_time, end_time)
+            assert sorted(members['waves']) == sorted(overlapping)
+            assert sorted(members['points']) == sorted(
+                key for key, member in composite_data.points.items()
+                if member.slice_range(begin_time, end_time) is not None)
+    composite_data = sm.Composite_data(
+        waves={'w%d' % i: random_wave() for i in range(10)},
+        points={'r': sm.Points(rng.uniform(0, 60, 30), rng.normal(size=30),
+                               'r')})
+    check_composite_data(composite_data)
+
+    print(">Próba wyszukania danych po zmianach w Composite_data")
+    for step in range(60):
+        key = 'w%d' % rng.integers(12)
+        if key in composite_data.waves and rng.uniform() < 0.3:
+            del composite_data.waves[key]
+        elif key in composite_data.waves and rng.uniform() < 0.5:
+            composite_data.waves[key].offset = rng.uniform(-5, 40)
+        elif rng.uniform() < 0.5:
+            composite_data.waves[key] = random_wave()
+        else:
+            composite_data.points['r'].add_point(rng.uniform(-10, 90), 0)
+        if step % 3 == 0:
+            check_composite_data(composite_data)
+    check_composite_data(composite_data)
+
+    print(">Próba wycięcia okien przebiegu z przerwą")
+    # Przerwa w próbkowaniu od 1 s do 3 s
+    timestamps = np.concatenate((np.arange(100), np.arange(300, 400))) / 100
+    irregular = sm.IrregularWave(np.arange(200.0), timestamps, 'ecg')
+    window = irregular.window(1.5, 2.5)
+    assert np.array_equal(window.data, [99, 100])
+    assert window.sample_length == irregular.sample_length
+    assert window.time_span()[1] <= irregular.time_span()[1]
+    assert np.allclose(window.coverage()[0], [0.99, 3.0])
+    window = irregular.window(0.5, 3.5)
+    assert np.allclose(window.coverage()[0], [0.5, 3.0])
+    assert irregular.window(3.995, 3.999) is None
+
+    print(">Próba utworzenia okien przesuwnych przebiegu z przerwą")
+    try:
+        irregular.sliding_windows(np.array([1.0, 2.0]), 1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Okna przebiegu z przerwą nie zostały '
+                             'odrzucone')
+    composite_data = sm.Composite_data(waves={'ecg': irregular})
+    try:
+        composite_data.sliding_windows(1, 1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Okna przebiegu z przerwą nie zostały '
+                             'odrzucone')
+
+    print(">Próba obliczenia wyrażenia na przebiegach")
+    bp_values = rng.normal(size=1000)
+    baseline_values = rng.normal(size=1200)
+    bp = sm.Wave(bp_values, 10, 'bp', offset=1)
+    baseline = sm.Wave(baseline_values, 12, 'baseline', offset=0.5)
+    expression = ((bp - baseline) * 2).derivative() ** 2 + bp
+    # Wspólny zakres czasu zaczyna się w 1 s, czyli 50 punktów baseline
+    difference = (bp_values - baseline_values[50:1050]) * 2
+    expected = np.gradient(difference, 0.01) ** 2 + bp_values
+    assert len(expression) == len(expected)
+    assert np.allclose(np.asarray(expression.data), expected)
+    for _ in range(20):
+        begin_i, end_i = np.sort(rng.integers(0, 1000, 2))
+        assert np.allclose(expression.data[begin_i:end_i],
+                           expected[begin_i:end_i])
+    indices = rng.integers(0, 1000, 50)
+    assert np.allclose(expression.data[..., indices], expected[indices])
+    assert np.allclose(expression.data_slice(3, 7.5), expected[200:650])
+    starts = np.array([1.5, 2.73, 8.0])
+    windows = expression.sliding_windows(starts, 1)
+    for window, start in zip(windows, starts):
+        start_i = expression.sample_at(start)
+        assert np.allclose(window, expected[start_i:start_i+100])
+
+    print(">Próba obliczenia wyrażenia po zmianie przebiegu")
+    bp.replace_slice(4, 5, sm.Wave(np.zeros(100), 1, 'bp'))
+    bp_values[300:400] = 0
+    difference = (bp_values - baseline_values[50:1050]) * 2
+    expected = np.gradient(difference, 0.01) ** 2 + bp_values
+    assert np.allclose(np.asarray(expression.data), expected)
+
+    print(">Próba dopisywania próbek do AppendableWave")
+    appended_values = rng.normal(size=1000)
+    appendable = sm.AppendableWave(100, 'bp', chunk_size=64)
+    for part in np.array_split(appended_values[:600], 7):
+        appendable.append(part)
+    snapshot = appendable.snapshot()
+    appendable.append(appended_values[600:])
+    assert np.array_equal(np.asarray(appendable.data), appended_values)
+    assert np.array_equal(np.asarray(snapshot.data), appended_values[:600])
+    assert np.array_equal(appendable.data_slice(1.3, 8.7), 
+                          appended_values[130:870])
+    assert appendable.range_max(0, 10) == np.max(appended_values)
+    for part in np.array_split(rng.normal(size=500), 9):
+        appendable.append(part)
+        appended_values = np.concatenate((appended_values, part))
+        # Zakres kończy się na ostatnim punkcie (patrz sample_at)
+        end_i = len(appended_values) - 1
+        begin_i = rng.integers(end_i)
+        begin_time = begin_i / 100
+        end_time = end_i / 100
+        expected = appended_values[begin_i:end_i]
+        assert np.isclose(appendable.range_sum(begin_time, end_time),
+                          np.sum(expected))
+        assert np.isclose(appendable.range_var(begin_time, end_time),
+                          np.var(expected))
+        assert appendable.range_min(begin_time, end_time) == np.min(expected)
+
+    print(">Próba eksportu AppendableWave i wyrażenia do pliku .bin")
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'wave.bin')
+        fm.export_line(file_name, appendable)
+        assert np.array_equal(np.fromfile(file_name), appended_values)
+        fm.export_line(file_name, expression)
+        assert np.array_equal(np.fromfile(file_name), 
+                              np.asarray(expression.data))
+finally:
+    sm.Points.block_size = points_block_size
+    sm._RangeStatistics.block_size = statistics_block_size
+    sm.WaveExpression.chunk_size = expression_chunk_size